@@ -84,6 +84,10 @@ then
                 qc_cmd="${qc_cmd}/genome_structural_annotation_sanity.py "
                 qc_cmd="$qc_cmd $imgap_input_fasta "
                 qc_cmd="$qc_cmd ${imgap_input_fasta%_*}_structural_annotation.gff"
+                if [[ -f ${imgap_input_fasta%_*}_structural_annotation.gff.cols ]]
+                then
+                    qc_cmd="$qc_cmd -c ${imgap_input_fasta%_*}_structural_annotation.gff.cols"
+                fi
                 $qc_cmd
                 exit_code=$?
                 if [[ $exit_code -ne 0 ]]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_output
+
+
+parser = argparse.ArgumentParser(description="""Benchmarks writing GFF lines
+                                 (as the hmmsearch hit selector writes them)
+                                 once via a print() per line with the line
+                                 built by '+' and once via the Gff_Writer.
+                                 Reports the lines and MB written per second,
+                                 for an uncompressed and a gzip compressed
+                                 output file.""",
+formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("-n", "--lines", type=int, default=1000000,
+                    help="number of GFF lines to write")
+parser.add_argument("-t", "--tmp_dir", help="""directory to write the output
+                    files to (the system default tmp dir if not given)""")
+args = parser.parse_args()
+
+
+def generate_hits(number_of_hits):
+    rng = random.Random(42)
+    hits = []
+    for i in range(number_of_hits):
+        env_start = rng.randint(1, 1000)
+        hmm_start = rng.randint(1, 100)
+        hits.append(["Ga0000001_" + str(i // 4 + 1), 1200,
+                     "TIGR%05d" % rng.randint(1, 4000), 350,
+                     "%.1e" % rng.uniform(1e-50, 1e-5),
+                     "%.1f" % rng.uniform(20, 500), hmm_start,
+                     hmm_start + rng.randint(50, 250), env_start,
+                     env_start + rng.randint(50, 200)])
+    return hits
+
+
+def write_with_print(hits, file_handle):
+    for fields in hits:
+        fake_percent_id = ((fields[7] - fields[6] + 1) / fields[3]) * 100
+        alignment_length = fields[9] - fields[8] + 1
+        print(fields[0] + "\t" +
+              "HMMER 3.1b2" + "\t" +
+              fields[2] + "\t" +
+              str(fields[8]) + "\t" +
+              str(fields[9]) + "\t" +
+              fields[5] + "\t.\t.\t" +
+              "ID=" + fields[0] + "_" + str(fields[8]) + "_" +
+              str(fields[9]) +
+              ";fake_percent_id=" + str("%.2f" % fake_percent_id) +
+              ";alignment_length=" + str(alignment_length) +
+              ";e-value=" + fields[4] +
+              ";model_start=" + str(fields[6]) +
+              ";model_end=" + str(fields[7]), file=file_handle)
+
+
+def write_with_gff_writer(hits, file_handle):
+    gff_writer = Gff_Writer(file_handle)
+    for fields in hits:
+        fake_percent_id = ((fields[7] - fields[6] + 1) / fields[3]) * 100
+        alignment_length = fields[9] - fields[8] + 1
+        gff_writer.write_row(
+            fields[0], "HMMER 3.1b2", fields[2], str(fields[8]),
+            str(fields[9]), fields[5], ".", ".",
+            "ID=%s_%d_%d;fake_percent_id=%.2f;alignment_length=%d;"
+            "e-value=%s;model_start=%d;model_end=%d" % (
+                fields[0], fields[8], fields[9], fake_percent_id,
+                alignment_length, fields[4], fields[6], fields[7]))
+    gff_writer.flush()
+
+
+def measure(write, hits, suffix):
+    fd, gff = tempfile.mkstemp(suffix=".gff" + suffix, dir=args.tmp_dir)
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        with open_output(gff) as file_handle:
+            write(hits, file_handle)
+        elapsed = time.perf_counter() - start
+        return elapsed, os.path.getsize(gff)
+    finally:
+        os.remove(gff)
+
+
+hits = generate_hits(args.lines)
+"""The size of the uncompressed output, for the MB/s."""
+number_of_bytes = 0
+for suffix in ("", ".gz"):
+    for name, write in (("print()", write_with_print),
+                        ("Gff_Writer", write_with_gff_writer)):
+        elapsed, file_size = measure(write, hits, suffix)
+        if not suffix:
+            number_of_bytes = file_size
+        print(name + (" (gzip)" if suffix else "") + ": " +
+              str(len(hits)) + " lines in " + "%.2f" % elapsed + "s (" +
+              "%.0f" % (len(hits) / elapsed) + " lines/s, " +
+              "%.1f" % (number_of_bytes / elapsed / 1024 / 1024) +
+              " MB/s), " + "%.1f" % (file_size / 1024 / 1024) +
+              " MB written")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir, "functional_annotation"))
+from imgap.intervals import Interval_Index
+from hmmsearch_hit_selector import (get_overlap_length,
+                                    is_not_significantly_overlapping)
+
+
+parser = argparse.ArgumentParser(description="""Benchmarks the overlap check
+                                 of hmmsearch_hit_selector.py on generated
+                                 proteins with a growing number of hits
+                                 (short repeat domains spread over the
+                                 protein). Compares the Interval_Index the
+                                 hit selector keeps the accepted hits in with
+                                 the linear scan over a list of all accepted
+                                 hits it used before, and checks that both
+                                 accept the same hits.""",
+formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("-n", "--hits", type=int, nargs="+",
+                    default=[10, 100, 1000, 10000],
+                    help="numbers of hits per protein to benchmark")
+parser.add_argument("-o", "--overlap_ratio", type=float, default=0.10,
+                    dest="max_overlap_ratio",
+                    help="the maximum allowed overlap ratio")
+args = parser.parse_args()
+
+
+def is_not_significantly_overlapping_in_list(stored_hits_list,
+                                             hit_coordinates,
+                                             max_overlap_ratio):
+    for stored_hit_coordinates in stored_hits_list:
+        overlap = get_overlap_length(stored_hit_coordinates, hit_coordinates)
+        overlap_ratio = overlap / min([
+                        (stored_hit_coordinates[1] -
+                         stored_hit_coordinates[0] + 1),
+                        (hit_coordinates[1] - hit_coordinates[0] + 1)])
+        if overlap_ratio > max_overlap_ratio:
+            return False
+    return True
+
+
+def generate_hits(number_of_hits):
+    """Repeat domains of 20 to 60 residues; the protein grows with the number
+    of hits, so a good part of them gets accepted."""
+    rng = random.Random(number_of_hits)
+    protein_length = number_of_hits * 20
+    hits = []
+    for i in range(number_of_hits):
+        start = rng.randint(1, protein_length)
+        hits.append([start, start + rng.randint(19, 59)])
+    return hits
+
+
+def select_with_list(hits):
+    accepted = []
+    for hit in hits:
+        if is_not_significantly_overlapping_in_list(accepted, hit,
+                                                    args.max_overlap_ratio):
+            accepted.append(hit)
+    return accepted
+
+
+def select_with_index(hits):
+    accepted = []
+    index = Interval_Index()
+    for hit in hits:
+        if is_not_significantly_overlapping(index, hit,
+                                            args.max_overlap_ratio):
+            index.add(hit[0], hit[1])
+            accepted.append(hit)
+    return accepted
+
+
+def measure(select, hits):
+    repeats = max(1, 20000 // len(hits))
+    start = time.perf_counter()
+    for i in range(repeats):
+        accepted = select(hits)
+    return (time.perf_counter() - start) / repeats, accepted
+
+
+for number_of_hits in args.hits:
+    hits = generate_hits(number_of_hits)
+    list_time, list_accepted = measure(select_with_list, hits)
+    index_time, index_accepted = measure(select_with_index, hits)
+    if list_accepted != index_accepted:
+        print("The selected hits differ for " + str(number_of_hits) +
+              " hits!", file=sys.stderr)
+        sys.exit(1)
+    print(str(number_of_hits) + " hits (" + str(len(index_accepted)) +
+          " accepted): linear scan " + "%.3f" % (list_time * 1000) +
+          " ms, interval index " + "%.3f" % (index_time * 1000) + " ms (" +
+          "%.1f" % (list_time / index_time) + "x)")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir, "functional_annotation"))
+from hmmsearch_fragmented_hits_filter import Hit, get_hit_fields
+
+
+parser = argparse.ArgumentParser(description="""Benchmarks the Hit records of
+                                 hmmsearch_fragmented_hits_filter.py on a
+                                 domtblout file (or on generated domtblout
+                                 lines). Reports the parse throughput (the
+                                 same column selection the WDL tasks do with
+                                 awk, plus creating the Hit) and the memory
+                                 each retained Hit takes, for the slotted
+                                 record and for an equivalent plain
+                                 (__dict__ backed) object.""",
+formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("domtblout", nargs="?",
+                    help="""domtblout file to parse (if not given, lines get
+                    generated)""")
+parser.add_argument("-g", "--generate", type=int, default=1000000,
+                    help="number of domtblout lines to generate")
+parser.add_argument("-s", "--sample", type=int, default=200000,
+                    help="number of hits to retain for the memory measurement")
+args = parser.parse_args()
+
+
+"""domtblout columns 1, 3, 4, 5, 6, 7, 8, 13, 14, 16, 17, 20, 21"""
+COLUMNS = (0, 2, 3, 4, 5, 6, 7, 12, 13, 15, 16, 19, 20)
+
+
+generated_lines = []
+Dict_Hit = type("Dict_Hit", (), {"__init__": Hit.__dict__["__init__"]})
+
+
+def generate_lines(number_of_lines):
+    rng = random.Random(42)
+    for i in range(number_of_lines):
+        gene_length = rng.randint(100, 1500)
+        model_length = rng.randint(50, 800)
+        model_start = rng.randint(1, model_length)
+        model_end = rng.randint(model_start, model_length)
+        gene_start = rng.randint(1, gene_length)
+        gene_end = rng.randint(gene_start, gene_length)
+        yield " ".join(["Ga0000001_" + str(i // 4 + 1), "-", str(gene_length),
+                        "PF%05d.1" % rng.randint(1, 20000), "PF%05d.1" % i,
+                        str(model_length), "2.1e-30", "105.3", "0.1", "1", "1",
+                        "1.1e-33", "3.4e-30", "104.2", "0.1", str(model_start),
+                        str(model_end), str(gene_start), str(gene_end),
+                        str(gene_start), str(gene_end), "0.97", "-"]) + "\n"
+
+
+def get_lines():
+    if args.domtblout:
+        with open(args.domtblout) as fr:
+            for line in fr:
+                if not line.startswith("#"):
+                    yield line
+    else:
+        for line in generated_lines:
+            yield line
+
+
+def get_fields(line):
+    fields = line.split()
+    return get_hit_fields([fields[i] for i in COLUMNS])
+
+
+def measure_throughput(record_class):
+    number_of_hits = 0
+    number_of_bytes = 0
+    start = time.perf_counter()
+    for line in get_lines():
+        record_class(get_fields(line))
+        number_of_hits += 1
+        number_of_bytes += len(line)
+    elapsed = time.perf_counter() - start
+    return number_of_hits, number_of_bytes, elapsed
+
+
+def measure_memory(record_class):
+    field_lists = []
+    for line in get_lines():
+        field_lists.append(get_fields(line))
+        if len(field_lists) == args.sample:
+            break
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [record_class(fields) for fields in field_lists]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    """Only the record itself (and its __dict__), without the shared field
+    values."""
+    record = records[0]
+    own_size = sys.getsizeof(record)
+    if hasattr(record, "__dict__"):
+        own_size += sys.getsizeof(record.__dict__)
+    return (after - before) / len(records), own_size
+
+
+if not args.domtblout:
+    """Generate up front, so the generation doesn't count towards the
+    throughput."""
+    generated_lines.extend(generate_lines(args.generate))
+for name, record_class in (("slotted Hit", Hit), ("__dict__ Hit", Dict_Hit)):
+    number_of_hits, number_of_bytes, elapsed = measure_throughput(record_class)
+    bytes_per_hit, own_size = measure_memory(record_class)
+    print(name + ": " + str(number_of_hits) + " hits in " +
+          "%.2f" % elapsed + "s (" +
+          "%.0f" % (number_of_hits / elapsed) + " hits/s, " +
+          "%.1f" % (number_of_bytes / elapsed / 1024 / 1024) + " MB/s), " +
+          "%.0f" % bytes_per_hit + " bytes allocated per retained hit, " +
+          str(own_size) + " bytes per record object")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import sys
+import time
+from statistics import median, mean, stdev
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.length_stats import get_length_stats
+
+
+parser = argparse.ArgumentParser(description="""Benchmarks the feature length
+                                 statistics of gff_and_final_fasta_stats.py on
+                                 a GFF file (or on generated feature lengths):
+                                 collecting every length in a list and running
+                                 the statistics module over it, against
+                                 collecting length histograms and computing the
+                                 statistics from them. Checks that both give
+                                 the same values.""",
+formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("gff_file", nargs="?",
+                    help="""GFF file to take the feature lengths from (if not
+                    given, lengths get generated)""")
+parser.add_argument("-n", "--features", type=int, default=50000000,
+                    help="number of feature lengths to generate")
+args = parser.parse_args()
+
+
+"""Feature types and the range of their lengths."""
+FEATURE_TYPES = (("CDS", 60, 6000), ("tRNA", 70, 95), ("rRNA", 100, 3000),
+                 ("CRISPR", 200, 5000))
+
+
+def generate_features(number_of_features):
+    """Yields (feature type, length), mostly CDSs. The lengths come from a
+    table of random values, so generating them is cheap."""
+    rng = random.Random(42)
+    table = []
+    for i in range(1 << 16):
+        feature_type, shortest, longest = FEATURE_TYPES[
+            0 if rng.random() < 0.97 else rng.randint(1, 3)]
+        table.append((feature_type, rng.randint(shortest, longest)))
+    mask = len(table) - 1
+    for i in range(number_of_features):
+        yield table[(i * 40503 + (i >> 16)) & mask]
+
+
+def read_features(gff_file):
+    with open(gff_file) as fr:
+        for line in fr:
+            if not line.strip() or line.startswith("#") or "Parent" in line:
+                continue
+            fields = line.split("\t")
+            yield fields[2], int(fields[4]) - int(fields[3]) + 1
+
+
+def get_features():
+    if args.gff_file:
+        return read_features(args.gff_file)
+    return generate_features(args.features)
+
+
+def get_list_stats(lengths):
+    """What gff_and_final_fasta_stats.py used to do."""
+    return {"Number of seqs": len(lengths),
+            "Number of bps": sum(lengths),
+            "Median length": round(median(lengths), 3),
+            "Average length": round(mean(lengths), 3),
+            "Length shortest seq": min(lengths),
+            "Length longest seq": max(lengths),
+            "Standard deviation": (round(stdev(lengths), 3)
+                                   if len(lengths) > 1 else 0)}
+
+
+def run_lists():
+    feature_lengths = {}
+    start = time.perf_counter()
+    for feature_type, length in get_features():
+        if feature_type in feature_lengths:
+            feature_lengths[feature_type].append(length)
+        else:
+            feature_lengths[feature_type] = [length]
+    collected = time.perf_counter()
+    stats = {feature_type: get_list_stats(lengths)
+             for feature_type, lengths in feature_lengths.items()}
+    size = sum(sys.getsizeof(lengths) for lengths in feature_lengths.values())
+    return stats, collected - start, time.perf_counter() - collected, size
+
+
+def run_histograms():
+    feature_lengths = {}
+    start = time.perf_counter()
+    for feature_type, length in get_features():
+        if feature_type not in feature_lengths:
+            feature_lengths[feature_type] = {}
+        histogram = feature_lengths[feature_type]
+        histogram[length] = histogram.get(length, 0) + 1
+    collected = time.perf_counter()
+    stats = {feature_type: get_length_stats(histogram)
+             for feature_type, histogram in feature_lengths.items()}
+    size = sum(sys.getsizeof(histogram)
+               for histogram in feature_lengths.values())
+    return stats, collected - start, time.perf_counter() - collected, size
+
+
+results = []
+for name, run in (("histograms", run_histograms), ("lists", run_lists)):
+    stats, collect_time, stats_time, size = run()
+    results.append(stats)
+    number_of_features = sum(feature_stats["Number of seqs"]
+                             for feature_stats in stats.values())
+    print(name + ": " + str(number_of_features) + " features collected in " +
+          "%.2f" % collect_time + "s, statistics in " +
+          "%.2f" % stats_time + "s, " +
+          "%.1f" % (size / 1024 / 1024) + " MB of containers (without the " +
+          "int objects)")
+for feature_type in results[0]:
+    for key, value in results[0][feature_type].items():
+        other_value = results[1][feature_type][key]
+        if value != other_value or type(value) != type(other_value):
+            print("Mismatch for " + feature_type + " " + key + ": " +
+                  repr(value) + " vs. " + repr(other_value), file=sys.stderr)
+            sys.exit(1)
+print("The statistics of both are identical.")
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
-import fileinput
-import subprocess
+
+from imgap.compressed_io import open_input, open_output
 
 
 parser = argparse.ArgumentParser(description="""This script will execute basic
@@ -33,20 +33,44 @@ parser.add_argument("-p", "--seq_name_prefix",
                     help="""if provided, sequence names will get replaced with
                     <seq_name_prefix>_<0-padded_seq_number>""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
+                    version="%(prog)s 1.0.1")
 args = parser.parse_args()
 
 
+"""Number of bytes to read at once."""
+BLOCK_SIZE = 1 << 24
+"""Maps ACGTN (in upper or lower case) to upper case and everything else to N
+in one bytes.translate() call."""
+CLEANING_TABLE = bytearray(b"N" * 256)
+for c in b"ACGTN":
+    CLEANING_TABLE[c] = c
+    CLEANING_TABLE[c + 32] = c
+CLEANING_TABLE = bytes(CLEANING_TABLE)
+"""Whitespace, other than the newlines, that has to get stripped from the end
+of the sequence lines."""
+LINE_END_WHITESPACE = (b"\r", b" ", b"\t", b"\x0b", b"\x0c")
+
+
+def count_sequences(fasta_file):
+    """Counts the header lines of the fasta file in large blocks (the input
+    might be compressed, so no grep)."""
+    seq_count = 0
+    at_line_start = True
+    with open_input(fasta_file, "rb") as fr:
+        for block in iter(lambda: fr.read(BLOCK_SIZE), b""):
+            if at_line_start and block.startswith(b">"):
+                seq_count += 1
+            seq_count += block.count(b"\n>")
+            at_line_start = block.endswith(b"\n")
+    return seq_count
+
+
 if args.seq_name_prefix:
     # Determine padding width
-    bash_cmd = "grep -c '^>' " + args.input_fasta + "; exit 0"
-    seq_count = subprocess.check_output(bash_cmd, shell=True).decode("utf-8")
-    seq_count = seq_count.rstrip()
-    padding_width = len(seq_count)
+    padding_width = len(str(count_sequences(args.input_fasta)))
     if padding_width == 1:
         padding_width = 2
 seq_counter = 0
-allowed = frozenset(["A", "C", "G", "T", "N"])
 output_fasta_fh = None
 kicked_out_seqs_fh = None
 names_map_fh = None
@@ -77,10 +101,11 @@ def write_sequence(old_seq_name, sequence, replaced_n_count):
         replaced_n_count_fh.write(seq_name + "\t" + replaced_n_count + "\n")
     global output_fasta_fh
     if not output_fasta_fh:
-        output_fasta_fh = open(args.output_fasta, 'w')
-    output_fasta_fh.write(">" + seq_name + "\n")
-    for i in range(0, len(sequence), 60):
-        output_fasta_fh.write(sequence[i:i+60]  + "\n")
+        output_fasta_fh = open_output(args.output_fasta, "wb")
+    lines = [b">" + seq_name.encode()]
+    lines.extend([sequence[i:i+60] for i in range(0, len(sequence), 60)])
+    lines.append(b"")
+    output_fasta_fh.write(b"\n".join(lines))
 
 
 def write_ignore_reason(seq_name, reason):
@@ -99,29 +124,68 @@ def check_and_clean_and_output(seq_name, sequence):
                             str(args.minimum_seq_length) + " nucleotides")
         return
     # Capitalize and replace all non-ACGT letters with N
-    sequence = sequence.upper()
-    pre_n_count = sequence.count("N")
-    sequence = "".join([c if c in allowed else "N" for c in sequence])
+    pre_n_count = sequence.count(b"N") + sequence.count(b"n")
+    sequence = sequence.translate(CLEANING_TABLE)
+    post_n_count = sequence.count(b"N")
     # Check if we only have Ns left
-    if sequence.count("N") == len(sequence):
+    if post_n_count == len(sequence):
         write_ignore_reason(seq_name, "sequence only contains Ns")
         return
-    post_n_count = sequence.count("N")
     write_sequence(seq_name, sequence, (post_n_count - pre_n_count))
 
 
+def read_records(fasta_fh):
+    """Yields the records of the fasta file as bytes, each starting with its
+    header line, except for anything before the first header line. The file
+    gets read in large blocks and split at the header lines, instead of line
+    by line."""
+    record_pieces = []
+    at_line_start = True
+    for block in iter(lambda: fasta_fh.read(BLOCK_SIZE), b""):
+        if at_line_start and block.startswith(b">") and record_pieces:
+            yield b"".join(record_pieces)
+            record_pieces = []
+        start = 0
+        end = block.find(b"\n>")
+        while end != -1:
+            record_pieces.append(block[start:end + 1])
+            yield b"".join(record_pieces)
+            record_pieces = []
+            start = end + 1
+            end = block.find(b"\n>", start)
+        record_pieces.append(block[start:])
+        at_line_start = block.endswith(b"\n")
+    if record_pieces:
+        yield b"".join(record_pieces)
+
+
+def join_sequence_lines(sequence_lines):
+    """Joins the lines without their trailing whitespace. Only needs to look
+    at the lines one by one if there is whitespace other than the newlines."""
+    for whitespace in LINE_END_WHITESPACE:
+        if whitespace in sequence_lines:
+            return b"".join([line.rstrip()
+                             for line in sequence_lines.split(b"\n")])
+    return sequence_lines.replace(b"\n", b"")
+
+
 seq_name = ""
-sequence = ""
-fasta_fh = open(args.input_fasta, "r")
-for line in fasta_fh:
-    line = line.rstrip()
-    if line.startswith(">"):
-        if seq_name:
-            check_and_clean_and_output(seq_name, sequence)
-        name_line_split = line[1:].split()
-        seq_name = name_line_split[0]
-        sequence = ""
-    else:
-        sequence += line
+sequence = b""
+with open_input(args.input_fasta, "rb") as fasta_fh:
+    for record in read_records(fasta_fh):
+        if record.startswith(b">"):
+            if seq_name:
+                check_and_clean_and_output(seq_name, sequence)
+            header_end = record.find(b"\n")
+            if header_end == -1:
+                header_end = len(record)
+            seq_name = record[1:header_end].decode().split()[0]
+            sequence = join_sequence_lines(record[header_end + 1:])
+        else:
+            sequence = join_sequence_lines(record)
 check_and_clean_and_output(seq_name, sequence)
 
+for file_handle in (output_fasta_fh, kicked_out_seqs_fh, names_map_fh,
+                    replaced_n_count_fh):
+    if file_handle:
+        file_handle.close()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
-import fileinput
 import os
-#import sys
+import sys
+from itertools import groupby
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.mapping_cache import parse_mapping_file, open_cache
+from imgap.compressed_io import (input_file_type, open_input, open_output,
+                                 get_compression_suffix)
 
 
 parser = argparse.ArgumentParser(description="""This script will assign names
@@ -22,7 +28,16 @@ parser = argparse.ArgumentParser(description="""This script will assign names
                                  corresponding terms will get concatenated to
                                  the product name via '/'. If a gene has
                                  multiple hits to the same ID its corresponding
-                                 term will only get listed once.""")
+                                 term will only get listed once.
+                                 With --merge_join all GFFs have to be sorted
+                                 by gene ID (in byte order, e.g. via
+                                 'LC_ALL=C sort -k1,1 -s' for the functional
+                                 annotation GFFs and by the ID attribute of the
+                                 CDS features for the structural annotation
+                                 GFF). The annotations then get read gene by
+                                 gene alongside the structural annotation GFF,
+                                 so the memory use doesn't grow with the
+                                 number of genes.""")
 parser.add_argument("mapping_dir",
                     help="""path to directory that contains the product names
                     mapping files""")
@@ -31,39 +46,46 @@ parser.add_argument("structural_annotation_gff",
                     annotations""")
 fa_files = parser.add_argument_group("GFFs also used for product name assignments")
 fa_files.add_argument("-k", "--ko",
-                    metavar="ko_file", type=argparse.FileType('r'),
+                    metavar="ko_file", type=input_file_type,
                     help="path to KO hits file")
 fa_files.add_argument("-t", "--tigrfam", metavar="tigrfam_file",
-                    type=argparse.FileType('r'),
+                    type=input_file_type,
                     help="path to TIGRfam hits file")
 fa_files.add_argument("-c", "--cog", metavar="cog_file",
-                    type=argparse.FileType('r'),
+                    type=input_file_type,
                     help="path to COG hits file")
 fa_files.add_argument("-p", "--pfam", metavar="pfam_file",
-                    type=argparse.FileType('r'),
+                    type=input_file_type,
                     help="path to Pfam hits file")
 additional_fa_files = parser.add_argument_group("GFFs not used for the product name assignments")
 additional_fa_files.add_argument("-f", "--cath_funfam",
                                  metavar="cath_funfam_file",
-                                 type=argparse.FileType('r'),
+                                 type=input_file_type,
                                  help="path to Cath-Funfam hits file")
 additional_fa_files.add_argument("-s", "--smart", metavar="smart_file",
-                                 type=argparse.FileType('r'),
+                                 type=input_file_type,
                                  help="path to SMART hits file")
 additional_fa_files.add_argument("-u", "--superfamily",
                                  metavar="superfamily_file",
-                                 type=argparse.FileType('r'),
+                                 type=input_file_type,
                                  help="path to SuperFamily hits file")
 additional_fa_files.add_argument("-e", "--cleavage_site",
                                  metavar="cleavage_site_file",
-                                 type=argparse.FileType('r'),
+                                 type=input_file_type,
                                  help="path to cleavage sites file")
 additional_fa_files.add_argument("-r", "--transmembrane_helix",
                                  metavar="transmembrane_helix_file",
-                                 type=argparse.FileType('r'),
+                                 type=input_file_type,
                                  help="path to transmembrane helices file")
+parser.add_argument("-d", "--cache_dir",
+                    help="""directory to keep a compiled cache of the product
+                    names mapping files in (gets built on the first run and
+                    reused as long as the mapping files don't change)""")
+parser.add_argument("-m", "--merge_join", action="store_true",
+                    help="""all GFFs are sorted by gene ID and get merged
+                    gene by gene instead of getting loaded into memory""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
+                    version="%(prog)s 1.2.0")
 args = parser.parse_args()
 if not (args.ko or args.tigrfam or args.cog or args.pfam):
     parser.error("""No functional annotation GFF files provided. Please provide
@@ -73,6 +95,8 @@ if not os.path.isdir(args.mapping_dir):
     parser.error(args.mapping_dir + " is not a directory.")
 if not os.access(args.mapping_dir, os.R_OK):
     parser.error(args.mapping_dir + " is not readable.")
+if args.cache_dir and not os.path.isdir(args.cache_dir):
+    parser.error(args.cache_dir + " is not a directory.")
 
 
 isology_ranking = {}
@@ -99,18 +123,29 @@ def create_isology_ranking():
 
 
 def parse_and_add_to_dict(tsv_file, mapping_dict):
-    for line in fileinput.input(tsv_file):
-        line = line.rstrip()
-        if line:
-            fa_id, value = line.split("\t")
-            mapping_dict[fa_id] = value
+    for fa_id, value in parse_mapping_file(tsv_file):
+        mapping_dict[fa_id] = value
 
 
 def create_lookups():
+    global id_to_name, tfam_to_isology
     tsv_files = [os.path.join(args.mapping_dir, ls_file) for ls_file in
-                os.listdir(args.mapping_dir) if ls_file.endswith(".tsv")]
+                sorted(os.listdir(args.mapping_dir)) if ls_file.endswith(".tsv")]
+    table_files = []
     for tsv_file in tsv_files:
         if tsv_file.endswith("tfam_isology.tsv"):
+            table_files.append(("tfam_to_isology", tsv_file))
+        else:
+            table_files.append(("id_to_name", tsv_file))
+    if args.cache_dir:
+        # Only the ids found in the GFFs get looked up in the cache
+        lookups = open_cache(args.cache_dir, "product_names",
+                             ("id_to_name", "tfam_to_isology"), table_files)
+        id_to_name = lookups["id_to_name"]
+        tfam_to_isology = lookups["tfam_to_isology"]
+        return
+    for table, tsv_file in table_files:
+        if table == "tfam_to_isology":
             parse_and_add_to_dict(tsv_file, tfam_to_isology)
         else:
             parse_and_add_to_dict(tsv_file, id_to_name)
@@ -228,25 +263,65 @@ def parse_fa_file(file_handle, fa_type):
     create_gene_mapping(prev_gene, ids, fa_type)
 
 
+def get_fa_files():
+    """The given functional annotation GFFs in the order they get processed
+    (the product name sources by priority first)."""
+    fa_files = [(args.ko, "ko"), (args.tigrfam, "tigrfam"), (args.cog, "cog"),
+                (args.pfam, "pfam"), (args.cath_funfam, "cath_funfam"),
+                (args.smart, "smart"), (args.superfamily, "superfamily"),
+                (args.cleavage_site, "cleavage_site_network"),
+                (args.transmembrane_helix, "transmembrane_helix_parts")]
+    return [(file_handle, fa_type) for file_handle, fa_type in fa_files
+            if file_handle]
+
+
 def process_fa_files():
-    if args.ko:
-        parse_fa_file(args.ko, "ko")
-    if args.tigrfam:
-        parse_fa_file(args.tigrfam, "tigrfam")
-    if args.cog:
-        parse_fa_file(args.cog, "cog")
-    if args.pfam:
-        parse_fa_file(args.pfam, "pfam")
-    if args.cath_funfam:
-        parse_fa_file(args.cath_funfam, "cath_funfam")
-    if args.smart:
-        parse_fa_file(args.smart, "smart")
-    if args.superfamily:
-        parse_fa_file(args.superfamily, "superfamily")
-    if args.cleavage_site:
-        parse_fa_file(args.cleavage_site, "cleavage_site_network")
-    if args.transmembrane_helix:
-        parse_fa_file(args.transmembrane_helix, "transmembrane_helix_parts")
+    for file_handle, fa_type in get_fa_files():
+        parse_fa_file(file_handle, fa_type)
+
+
+
+class Sorted_Fa_File:
+    """Reads a functional annotation GFF sorted by gene ID gene by gene."""
+
+    def __init__(self, file_handle, fa_type):
+        self.fa_type = fa_type
+        self.gene_lines = self.read_gene_lines(file_handle)
+        self.next_gene_lines = next(self.gene_lines, None)
+
+
+    def read_gene_lines(self, file_handle):
+        previous_gene = None
+        for gene_id, lines in groupby(file_handle,
+                                      lambda line: line.split("\t", 1)[0]):
+            if previous_gene is not None and gene_id < previous_gene:
+                print(file_handle.name + " is not sorted by gene ID (" +
+                      gene_id + " after " + previous_gene + ").",
+                      file=sys.stderr)
+                sys.exit(1)
+            previous_gene = gene_id
+            yield gene_id, list(lines)
+
+
+    def get_lines(self, gene_id):
+        """Returns the lines of the given gene and skips the ones of genes
+        sorted before it (which aren't in the structural annotation)."""
+        lines = []
+        while (self.next_gene_lines is not None and
+               self.next_gene_lines[0] <= gene_id):
+            if self.next_gene_lines[0] == gene_id:
+                lines.extend(self.next_gene_lines[1])
+            self.next_gene_lines = next(self.gene_lines, None)
+        return lines
+
+
+
+def load_gene_annotations(gene_id, sorted_fa_files):
+    """Replaces the stored annotations by the ones of the given gene."""
+    gene_to_product_name.clear()
+    for sorted_fa_file in sorted_fa_files:
+        parse_fa_file(sorted_fa_file.get_lines(gene_id),
+                      sorted_fa_file.fa_type)
 
 
 def add_annotations(attributes_field, annotations_dict):
@@ -267,9 +342,13 @@ def add_annotations(attributes_field, annotations_dict):
     return attributes_field
 
 
+def get_gene_id(fields):
+    return fields[-1].split(";", 1)[0].split("=", 1)[1]
+
+
 def get_product_name_and_gff_lines(fields):
     product_name_line = ""
-    gene_id = fields[-1].split(";", 1)[0].split("=", 1)[1]
+    gene_id = get_gene_id(fields)
 #    print("\nChecking " + gene_id + " (" + fields[2] + ")", file=sys.stderr)
     if fields[2] == "CDS":
         if gene_id in gene_to_product_name:
@@ -311,19 +390,35 @@ def get_product_name_and_gff_lines(fields):
 
 create_isology_ranking()
 create_lookups()
-process_fa_files()
+if args.merge_join:
+    sorted_fa_files = [Sorted_Fa_File(file_handle, fa_type)
+                       for file_handle, fa_type in get_fa_files()]
+else:
+    process_fa_files()
 
 # Create output files
 functional_annotation_gff = args.structural_annotation_gff.replace("_structural_",
                                                                    "_functional_")
 product_names_file = args.structural_annotation_gff[:args.structural_annotation_gff.rfind("structural")]
-product_names_file += "product_names.tsv"
-sa_gff_fh = open(args.structural_annotation_gff, "r")
-fa_gff_fh = open(functional_annotation_gff, "w")
-product_names_fh = open(product_names_file, "w")
+product_names_file += ("product_names.tsv" +
+                       get_compression_suffix(args.structural_annotation_gff))
+sa_gff_fh = open_input(args.structural_annotation_gff)
+fa_gff_fh = open_output(functional_annotation_gff)
+product_names_fh = open_output(product_names_file)
+current_gene = None
 # Run over structural annotation gff
 for gff_line in sa_gff_fh:
     fields = gff_line.rstrip().split("\t")
+    if args.merge_join and fields[2] == "CDS":
+        gene_id = get_gene_id(fields)
+        if current_gene is not None and gene_id < current_gene:
+            print(args.structural_annotation_gff + " is not sorted by gene " +
+                  "ID (" + gene_id + " after " + current_gene + ").",
+                  file=sys.stderr)
+            sys.exit(1)
+        if gene_id != current_gene:
+            load_gene_annotations(gene_id, sorted_fa_files)
+            current_gene = gene_id
     if fields[2] == "CDS" or fields[2].endswith("RNA"):
         product_name_line, gff_line = get_product_name_and_gff_lines(fields)
         product_names_fh.write(product_name_line + "\n")
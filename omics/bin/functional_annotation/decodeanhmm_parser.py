@@ -2,8 +2,14 @@
 
 import argparse
 import fileinput
+import os
 import sys
 
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input
+
 parser = argparse.ArgumentParser(description="""This script parses the
                                  decodeanhmm output and transforms it into gff
                                  format, which gets printed to stdout.
@@ -17,7 +23,8 @@ parser.add_argument("decodeanhmm_version", metavar="decodeanhmm_version",
 args, input = parser.parse_known_args()
 
 gene_id = ""
-for line in fileinput.input(input):
+gff_writer = Gff_Writer()
+for line in fileinput.input(input, openhook=open_input):
     if line.startswith(">"):
         # We got a new sequence
         gene_id = line[1:].rstrip().split(" ")[0]
@@ -38,7 +45,7 @@ for line in fileinput.input(input):
                 else:
                     print("Unknown feature type: " + feature_type, sys.stderr)
                     sys.exit(1)
-                gff_line = gene_id + "\t" + args.decodeanhmm_version + "\t"
-                gff_line += feature_type + "\t" + start + "\t" + end
-                gff_line += "\t.\t.\t.\tID=" + gene_id + "_" + start + "_" + end
-                print(gff_line)
+                gff_writer.write_row(gene_id, args.decodeanhmm_version,
+                                     feature_type, start, end, ".", ".", ".",
+                                     "ID=" + gene_id + "_" + start + "_" + end)
+gff_writer.flush()
@@ -378,6 +378,10 @@ if [[ -f ${imgap_input_fasta%_*}_structural_annotation.gff ]]
 then
 	echo "$(date +%F_%T) - Assigning product names now..."
     echo "Product Name Assignment" >> $run_folder/started_modules.log
+	if [[ ! -z "$imgap_functional_annotation_product_names_cache_dir" ]]
+	then
+		cmd_args="$cmd_args -d $imgap_functional_annotation_product_names_cache_dir"
+	fi
 	cmd_args="$cmd_args $imgap_functional_annotation_product_names_mapping_dir"
 	cmd_args="$cmd_args ${imgap_input_fasta%_*}_structural_annotation.gff"
 	/usr/bin/time $(dirname $0)/assign_product_names_and_create_fa_gff.py \
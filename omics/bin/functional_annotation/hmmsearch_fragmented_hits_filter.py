@@ -2,8 +2,18 @@
 
 import argparse
 import fileinput
+import os
 import sys
 
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.records import Record, UNSET
+from imgap.intervals import get_coverage, get_coverage_overlap_length
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input
+from imgap.hmmer_tables import (read_domtblout, open_tables,
+                                get_merged_hits_by_target)
+
 
 parser = argparse.ArgumentParser(description="""This script expects to get
 columns 1, 3, 4, 5, 6, 7, 8, 13, 14, 16, 17, 20, 21 (gene_id, gene_length,
@@ -16,7 +26,10 @@ calculates the cumulative alignment length. If the cumulative alignment length
 is not covering at least 70% of the shorter of the gene or model length the
 fragmented hit gets ignored. If two fragmented hits overlap for more than 10%
 the fragmented hit with the lower full sequence bitscore gets removed.
-The remaining hits/fragments get printed to stdout in GFF format.""",
+The remaining hits/fragments get printed to stdout in GFF format.
+With --domtblout the input is the domtblout itself, as written by hmmsearch,
+and the columns get selected and sorted by the script. Several domtblouts (e.g.
+of hmmsearch runs on splits of the proteins FASTA) get merged.""",
 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("hmmer_version", metavar="hmmer_version",
                     help="hmmer version used to create the output")
@@ -30,16 +43,38 @@ parser.add_argument("-o", "--overlap_ratio_cutoff", nargs="?",
                     dest="max_overlap_ratio_cutoff", type=float,
                     default=0.10, help="""the maximum allowed overlap ratio on
                     the shorter hit""")
+parser.add_argument("-d", "--domtblout", action="store_true",
+                    help="""the input is an unsorted domtblout instead of the
+                    selected and sorted columns""")
+parser.add_argument("-m", "--max_hits_in_memory", type=int, default=2000000,
+                    help="""maximum number of hits to sort in memory with
+                    --domtblout (more hits get sorted in runs that are
+                    written to tmp files and merged)""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.1")
-args, input = parser.parse_known_args()
+                    version="%(prog)s 1.1.1")
+
+
+"""The domtblout columns the script expects, in the expected order."""
+DOMTBLOUT_ATTRIBUTES = ("target_name", "target_length", "query_name",
+                        "query_accession", "query_length", "full_seq_evalue",
+                        "full_seq_bitscore", "domain_i_evalue",
+                        "domain_bitscore", "hmm_start", "hmm_end", "env_start",
+                        "env_end")
+
 
 
+class Hit(Record):
+    __slots__ = ("gene_name", "gene_length", "model", "accession",
+                 "model_length", "full_seq_evalue", "full_seq_bitscore",
+                 "domain_evalue", "domain_bitscore", "model_start", "model_end",
+                 "fake_percent_id", "gene_start", "gene_end",
+                 "alignment_length")
 
-class Hit:
     def __init__(self, hit_fields):
+        """Expects the lengths and coordinates as ints (see
+        get_hit_fields())."""
         self.gene_name = hit_fields[0]
-        self.gene_length = int(hit_fields[1])
+        self.gene_length = hit_fields[1]
         self.model = hit_fields[2]
         self.accession = hit_fields[3]
         if self.accession == "-":
@@ -47,47 +82,46 @@ class Hit:
         if "/" in self.accession:
             # For Cath-FunFam remove everything in the accession from the 1st '/' on.
             self.accession = self.accession[:self.accession.find("/")]
-        self.model_length = int(hit_fields[4])
+        self.model_length = hit_fields[4]
         self.full_seq_evalue = hit_fields[5]
         self.full_seq_bitscore = float(hit_fields[6])
         self.domain_evalue = hit_fields[7]
         self.domain_bitscore = hit_fields[8]
-        self.model_start = int(hit_fields[9])
-        self.model_end = int(hit_fields[10])
+        self.model_start = hit_fields[9]
+        self.model_end = hit_fields[10]
         self.fake_percent_id = ((self.model_end - self.model_start + 1) /
                                 self.model_length) * 100
-        self.gene_start = int(hit_fields[11])
-        self.gene_end = int(hit_fields[12])
+        self.gene_start = hit_fields[11]
+        self.gene_end = hit_fields[12]
         self.alignment_length = self.gene_end - self.gene_start + 1
 
 
-    def to_gff(self):
-        print(self.gene_name + "\t" +
-              args.hmmer_version + "\t" +
-              self.accession + "\t" +
-              str(self.gene_start) + "\t" +
-              str(self.gene_end) + "\t" +
-              self.domain_bitscore + "\t" +
-              ".\t.\t" +                       # Strand and Phase
-              "ID=" + self.gene_name + "_" +   # Start of attributes field
-              str(self.gene_start) + "_" +
-              str(self.gene_end) +
-              ";fake_percent_id=" +
-              str("%.2f" % (((self.model_end - self.model_start + 1) /
-                            self.model_length) * 100)) +
-              ";alignment_length=" + str(self.alignment_length) +
-              ";independent_domain_e-value=" + self.domain_evalue +
-              ";full_sequence_e-value=" + self.full_seq_evalue +
-              ";full_sequence_bitscore=" + str(self.full_seq_bitscore) +
-              ";model_start=" + str(self.model_start) +
-              ";model_end=" + str(self.model_end))
+    def to_gff(self, hmmer_version, gff_writer):
+        gff_writer.write_row(
+            self.gene_name, hmmer_version, self.accession,
+            str(self.gene_start), str(self.gene_end), self.domain_bitscore,
+            ".", ".",                                   # Strand and Phase
+            "ID=%s_%d_%d;fake_percent_id=%.2f;alignment_length=%d;"
+            "independent_domain_e-value=%s;full_sequence_e-value=%s;"
+            "full_sequence_bitscore=%s;model_start=%d;model_end=%d" % (
+                self.gene_name, self.gene_start, self.gene_end,
+                ((self.model_end - self.model_start + 1) /
+                 self.model_length) * 100,
+                self.alignment_length, self.domain_evalue,
+                self.full_seq_evalue, self.full_seq_bitscore,
+                self.model_start, self.model_end))
 
 
 
-class Fragmented_Hit:
+class Fragmented_Hit(Record):
+    __slots__ = ("fragments", "cum_aln_length", "full_seq_bitscore",
+                 "coverage")
 
     def __init__(self, hit):
         self.fragments = [hit]
+        self.cum_aln_length = UNSET
+        self.full_seq_bitscore = UNSET
+        self.coverage = UNSET
 
 
     def add_hit_fragment(self, hit):
@@ -101,17 +135,32 @@ class Fragmented_Hit:
 
 
     def get_cumulative_length(self):
-        if not hasattr(self, 'cum_aln_length'):
+        if self.cum_aln_length is UNSET:
             self.calculate_cumulative_length()
         return self.cum_aln_length
 
 
     def get_full_seq_bitscore(self):
-        if not hasattr(self, 'full_Seq_bitscore'):
+        if self.full_seq_bitscore is UNSET:
             self.full_seq_bitscore = self.fragments[0].full_seq_bitscore
         return self.full_seq_bitscore
 
 
+    def get_coverage(self):
+        """The gene positions covered by the fragments as sorted (start, end,
+        depth) segments (see imgap.intervals.get_coverage())."""
+        if self.coverage is UNSET:
+            self.coverage = get_coverage([(fragment.gene_start,
+                                           fragment.gene_end)
+                                          for fragment in self.fragments])
+        return self.coverage
+
+
+    def get_span(self):
+        coverage = self.get_coverage()
+        return coverage[0][0], coverage[-1][1]
+
+
     def sort_and_verify_fragments_have_same_full_seq_bitscore(self):
         self.fragments.sort(key=lambda x: x.gene_start) # Sort by gene start
         full_seq_bitscore = self.get_full_seq_bitscore()
@@ -126,15 +175,20 @@ class Fragmented_Hit:
                 sys.exit(1)
 
 
-    def output_fragments_as_gff(self):
+    def output_fragments_as_gff(self, hmmer_version, gff_writer):
         for fragment in self.fragments:
-            fragment.to_gff()
+            fragment.to_gff(hmmer_version, gff_writer)
 
 
 
 class Fragmented_Hit_Filter:
 
-    def __init__(self):
+    def __init__(self, hmmer_version, gff_writer, min_aln_len_ratio=0.7,
+                 max_overlap_ratio_cutoff=0.10):
+        self.hmmer_version = hmmer_version
+        self.gff_writer = gff_writer
+        self.min_aln_len_ratio = min_aln_len_ratio
+        self.max_overlap_ratio_cutoff = max_overlap_ratio_cutoff
         self.fragmented_hits = {}
 
 
@@ -146,34 +200,22 @@ class Fragmented_Hit_Filter:
             self.fragmented_hits[hit.model].add_hit_fragment(hit)
 
 
-    def get_overlap_length(self, fragment_start, fragment_end,
-                         other_fragment_start, other_fragment_end):
-        # First check if the overlaps overlap at all
-        if fragment_start > other_fragment_end or fragment_end < other_fragment_start:
-            return 0
-
-        overlap_start = max(fragment_start, other_fragment_start)
-        overlap_end = min(fragment_end, other_fragment_end)
-        return overlap_end - overlap_start + 1
-
-
     def is_significantly_overlapping(self, fragment, other_fragment,
                                      overlap_size):
         overlap_ratio = overlap_size / min(fragment.get_cumulative_length(),
                                            other_fragment.get_cumulative_length())
 
-        if overlap_ratio > args.max_overlap_ratio_cutoff:
+        if overlap_ratio > self.max_overlap_ratio_cutoff:
             return True
 
         return False
 
 
     def get_conflicting_fragment(self, fragmented_hit, other_fragmented_hit):
-        overlap_size = 0
-        for fragment in fragmented_hit.fragments:
-            for other_fragment in other_fragmented_hit.fragments:
-                overlap_size += self.get_overlap_length(fragment.gene_start, fragment.gene_end,
-                                                        other_fragment.gene_start, other_fragment.gene_end)
+        # Sum of the overlaps of all fragment pairs
+        overlap_size = get_coverage_overlap_length(
+                           fragmented_hit.get_coverage(),
+                           other_fragmented_hit.get_coverage())
 
         if self.is_significantly_overlapping(fragmented_hit,
                                              other_fragmented_hit,
@@ -195,10 +237,16 @@ class Fragmented_Hit_Filter:
             if models[i] in ignore:
                 continue
             fragmented_hit = self.fragmented_hits[models[i]]
+            start, end = fragmented_hit.get_span()
             for j in range(i+1, len(models)):
                 if models[j] in ignore:
                     continue
                 other_fragmented_hit = self.fragmented_hits[models[j]]
+                other_start, other_end = other_fragmented_hit.get_span()
+                if ((other_start > end or other_end < start) and
+                        self.max_overlap_ratio_cutoff >= 0):
+                    # Hits that don't overlap at all can't conflict
+                    continue
                 fragment_to_ignore = self.get_conflicting_fragment(fragmented_hit,
                                                               other_fragmented_hit)
                 if fragment_to_ignore == 1:
@@ -218,7 +266,7 @@ class Fragmented_Hit_Filter:
             gene_length = fragmented_hit.fragments[0].gene_length
             model_length = fragmented_hit.fragments[0].model_length
             if ((fragmented_hit.get_cumulative_length() /
-                 min(gene_length, model_length)) < args.min_aln_len_ratio):
+                 min(gene_length, model_length)) < self.min_aln_len_ratio):
                 remove.append(model)
         for model in remove:
             del self.fragmented_hits[model]
@@ -231,7 +279,8 @@ class Fragmented_Hit_Filter:
 
     def output_hits_as_gff(self):
         for model in self.fragmented_hits:
-            self.fragmented_hits[model].output_fragments_as_gff()
+            self.fragmented_hits[model].output_fragments_as_gff(
+                self.hmmer_version, self.gff_writer)
 
 
     def process_and_print_out_final_hits(self):
@@ -242,22 +291,66 @@ class Fragmented_Hit_Filter:
 
 
 
-previous_gene = ""
-fragmented_hit_filter = Fragmented_Hit_Filter()
-# Run over stdin
-for line in fileinput.input(input):
-    line = line.rstrip()
-    fields = line.split()
-    hit = Hit(fields)
-
-    if hit.gene_name != previous_gene:
-        # Now we look at the hits for a new gene and thus
-        # the stored (fragmented) hits for the previous
-        # genes need to be processed and printed out.
+def get_hit_fields(fields):
+    fields[1] = int(fields[1])
+    fields[4] = int(fields[4])
+    fields[9] = int(fields[9])
+    fields[10] = int(fields[10])
+    fields[11] = int(fields[11])
+    fields[12] = int(fields[12])
+    return fields
+
+
+def filter_domtblouts(domtblouts, hmmer_version, gff_writer,
+                      min_aln_len_ratio=0.7, max_overlap_ratio_cutoff=0.10,
+                      max_hits_in_memory=None):
+    hit_streams = [read_domtblout(domtblout) for domtblout in domtblouts]
+    for gene, gene_hits in get_merged_hits_by_target(hit_streams,
+                                                     DOMTBLOUT_ATTRIBUTES,
+                                                     "full_seq_bitscore",
+                                                     "full_seq_evalue",
+                                                     max_hits_in_memory):
+        fragmented_hit_filter = Fragmented_Hit_Filter(
+            hmmer_version, gff_writer, min_aln_len_ratio,
+            max_overlap_ratio_cutoff)
+        for hit_fields in gene_hits:
+            fragmented_hit_filter.add_hit(Hit(hit_fields))
         fragmented_hit_filter.process_and_print_out_final_hits()
-        previous_gene = hit.gene_name
-        fragmented_hit_filter = Fragmented_Hit_Filter()
 
-    fragmented_hit_filter.add_hit(hit)
-fragmented_hit_filter.process_and_print_out_final_hits()
+
+if __name__ == "__main__":
+    args, input = parser.parse_known_args()
+
+    gff_writer = Gff_Writer()
+    if args.domtblout:
+        filter_domtblouts(open_tables(input), args.hmmer_version, gff_writer,
+                          args.min_aln_len_ratio,
+                          args.max_overlap_ratio_cutoff,
+                          args.max_hits_in_memory)
+        gff_writer.flush()
+        sys.exit(0)
+
+    previous_gene = ""
+    fragmented_hit_filter = Fragmented_Hit_Filter(
+        args.hmmer_version, gff_writer, args.min_aln_len_ratio,
+        args.max_overlap_ratio_cutoff)
+    # Run over stdin
+    for line in fileinput.input(input, openhook=open_input):
+        line = line.rstrip()
+        fields = line.split()
+        hit = Hit(get_hit_fields(fields))
+
+        if hit.gene_name != previous_gene:
+            # Now we look at the hits for a new gene and thus
+            # the stored (fragmented) hits for the previous
+            # genes need to be processed and printed out.
+            fragmented_hit_filter.process_and_print_out_final_hits()
+            previous_gene = hit.gene_name
+            fragmented_hit_filter = Fragmented_Hit_Filter(
+                args.hmmer_version, gff_writer, args.min_aln_len_ratio,
+                args.max_overlap_ratio_cutoff)
+
+        fragmented_hit_filter.add_hit(hit)
+    fragmented_hit_filter.process_and_print_out_final_hits()
+    gff_writer.flush()
 
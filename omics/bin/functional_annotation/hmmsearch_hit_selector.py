@@ -2,6 +2,16 @@
 
 import argparse
 import fileinput
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.hmmer_tables import (read_domtblout, open_tables,
+                                get_merged_hits_by_target)
+from imgap.intervals import Interval_Index
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input
 
 
 parser = argparse.ArgumentParser(description="""This script expects to get
@@ -17,7 +27,10 @@ When an overlap is considered significant can be influenced by changing
 the value of the over_ratio_cutoff argument.
 The default is set to 0.10, which would ignore the lower scoring hit of
 two hits that overlap by  more than 10% of the length of the shorter of
-the two hits.""",
+the two hits.
+With --domtblout the input is the domtblout itself, as written by hmmsearch,
+and the columns get selected and sorted by the script. Several domtblouts (e.g.
+of hmmsearch runs on splits of the proteins FASTA) get merged.""",
 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("hmmer_version", metavar="hmmer_version",
                     help="hmmer version used to create the output")
@@ -29,14 +42,27 @@ parser.add_argument("-o", "--overlap_ratio", nargs="?",
                     metavar="max_overlap_ratio", dest="max_overlap_ratio",
                     type=float, default=0.10, help="""the maximum allowed
                     overlap ratio on the shorter hit""")
+parser.add_argument("-d", "--domtblout", action="store_true",
+                    help="""the input is an unsorted domtblout instead of the
+                    selected and sorted columns""")
+parser.add_argument("-m", "--max_hits_in_memory", type=int, default=2000000,
+                    help="""maximum number of hits to sort in memory with
+                    --domtblout (more hits get sorted in runs that are
+                    written to tmp files and merged)""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
-args, input = parser.parse_known_args()
+                    version="%(prog)s 1.1.1")
+
 
+"""The domtblout columns the script expects, in the expected order."""
+DOMTBLOUT_ATTRIBUTES = ("target_name", "target_length", "query_name",
+                        "query_length", "domain_i_evalue", "domain_bitscore",
+                        "hmm_start", "hmm_end", "env_start", "env_end")
 
-def alignment_ratio_is_met(gene_length, model_length, alignment_length):
+
+def alignment_ratio_is_met(gene_length, model_length, alignment_length,
+                           min_aln_len_ratio):
     if alignment_length >= (min(gene_length, model_length) *
-                            args.min_aln_len_ratio):
+                            min_aln_len_ratio):
         return True
     else:
         return False
@@ -52,57 +78,103 @@ def get_overlap_length(hit_a_coordinates, hit_b_coordinates):
     return overlap_end - overlap_start + 1
 
 
-def is_not_significantly_overlapping(stored_hits_list, hit_coordinates):
-    if not stored_hits_list:
+def is_not_significantly_overlapping(stored_hits, hit_coordinates,
+                                     max_overlap_ratio):
+    """Expects the stored hits as an imgap.intervals.Interval_Index, so only
+    the stored hits that actually overlap the hit need to get checked."""
+    if not stored_hits:
         return True
+    if max_overlap_ratio < 0:
+        # Even stored hits that don't overlap at all exceed the ratio
+        return False
 
-    for stored_hit_coordinates in stored_hits_list:
+    for stored_hit_coordinates in stored_hits.get_overlapping(
+                                      *hit_coordinates):
         overlap = get_overlap_length(stored_hit_coordinates, hit_coordinates)
         overlap_ratio = overlap / min([
                         (stored_hit_coordinates[1] -
                          stored_hit_coordinates[0] + 1),
                         (hit_coordinates[1] - hit_coordinates[0] + 1)])
-        if overlap_ratio > args.max_overlap_ratio:
+        if overlap_ratio > max_overlap_ratio:
             return False
 
     return True
 
 
-previous_gene = ""
-non_overlapping_hits = []
-# Run over stdin
-for line in fileinput.input(input):
-    line = line.rstrip()
+def get_hit_fields(fields):
     # fields: gene, gene_len, cog, cog_len, evalue, bitscore,
     #         hmm_start, hmm_stop, env_start, env_stop
-    fields = line.split()
     fields[1] = int(fields[1])
     fields[3] = int(fields[3])
     fields[6] = int(fields[6])
     fields[7] = int(fields[7])
     fields[8] = int(fields[8])
     fields[9] = int(fields[9])
-    alignment_length = fields[9] - fields[8] + 1
-
-    if fields[0] != previous_gene:
-        # Now we look at the hits for a new gene
-        non_overlapping_hits = []
-        previous_gene = fields[0]
-
-    if (alignment_ratio_is_met(fields[1], fields[3], alignment_length) and
-        is_not_significantly_overlapping(non_overlapping_hits, [fields[8],
-                                                                fields[9]])):
-        non_overlapping_hits.append([fields[8], fields[9]])
-        fake_percent_id = ((fields[7] - fields[6] + 1) / fields[3]) * 100
-        # Print out valid hits in gff format.
-        print(fields[0] + "\t" +
-              args.hmmer_version + "\t" +
-              fields[2] + "\t" +
-              str(fields[8]) + "\t" +
-              str(fields[9]) + "\t" +
-              fields[5] + "\t.\t.\t" +
-              "ID=" + fields[0] + "_" + str(fields[8]) + "_" + str(fields[9]) +
-              ";fake_percent_id=" + str("%.2f" % fake_percent_id) +
-              ";alignment_length=" + str(alignment_length) +
-              ";e-value=" + fields[4] +
-              ";model_start=" + str(fields[6]) + ";model_end=" + str(fields[7]))
+    return fields
+
+
+def select_gene_hits(gene_hits, hmmer_version, min_aln_len_ratio,
+                     max_overlap_ratio, gff_writer):
+    """Expects the hits of one gene (see get_hit_fields()), sorted by bitscore
+    and evalue, and writes out the selected ones in GFF format."""
+    non_overlapping_hits = Interval_Index()
+    for fields in gene_hits:
+        alignment_length = fields[9] - fields[8] + 1
+        if (alignment_ratio_is_met(fields[1], fields[3], alignment_length,
+                                   min_aln_len_ratio) and
+            is_not_significantly_overlapping(non_overlapping_hits,
+                                             [fields[8], fields[9]],
+                                             max_overlap_ratio)):
+            non_overlapping_hits.add(fields[8], fields[9])
+            fake_percent_id = ((fields[7] - fields[6] + 1) / fields[3]) * 100
+            # Write out valid hits in gff format.
+            gff_writer.write_row(
+                fields[0], hmmer_version, fields[2], str(fields[8]),
+                str(fields[9]), fields[5], ".", ".",
+                "ID=%s_%d_%d;fake_percent_id=%.2f;alignment_length=%d;"
+                "e-value=%s;model_start=%d;model_end=%d" % (
+                    fields[0], fields[8], fields[9], fake_percent_id,
+                    alignment_length, fields[4], fields[6], fields[7]))
+
+
+def filter_domtblouts(domtblouts, hmmer_version, min_aln_len_ratio,
+                      max_overlap_ratio, gff_writer, max_hits_in_memory=None):
+    hit_streams = [read_domtblout(domtblout) for domtblout in domtblouts]
+    for gene, gene_hits in get_merged_hits_by_target(hit_streams,
+                                                     DOMTBLOUT_ATTRIBUTES,
+                                                     "domain_bitscore",
+                                                     "domain_i_evalue",
+                                                     max_hits_in_memory):
+        select_gene_hits(gene_hits, hmmer_version, min_aln_len_ratio,
+                         max_overlap_ratio, gff_writer)
+
+
+if __name__ == "__main__":
+    args, input = parser.parse_known_args()
+
+    gff_writer = Gff_Writer()
+    if args.domtblout:
+        filter_domtblouts(open_tables(input), args.hmmer_version,
+                          args.min_aln_len_ratio, args.max_overlap_ratio,
+                          gff_writer, args.max_hits_in_memory)
+        gff_writer.flush()
+        sys.exit(0)
+
+    previous_gene = ""
+    gene_hits = []
+    # Run over stdin
+    for line in fileinput.input(input, openhook=open_input):
+        fields = get_hit_fields(line.rstrip().split())
+
+        if fields[0] != previous_gene:
+            # Now we look at the hits for a new gene
+            select_gene_hits(gene_hits, args.hmmer_version,
+                             args.min_aln_len_ratio, args.max_overlap_ratio,
+                             gff_writer)
+            gene_hits = []
+            previous_gene = fields[0]
+
+        gene_hits.append(fields)
+    select_gene_hits(gene_hits, args.hmmer_version, args.min_aln_len_ratio,
+                     args.max_overlap_ratio, gff_writer)
+    gff_writer.flush()
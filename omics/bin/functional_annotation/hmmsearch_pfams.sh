@@ -51,6 +51,7 @@ then
 fi
 
 
+split_domtblouts=""
 if [[ $number_of_additional_threads -gt $number_of_parallel_hmmsearch_instances ]]
 then
     hmmsearch_threads=$(echo $number_of_additional_threads / $number_of_parallel_hmmsearch_instances | bc)
@@ -82,17 +83,7 @@ then
         exit $exit_code
     fi
 
-    echo "$(date +%F_%T) - Concatenating split result files now..."
-    cat $tmp_dir/tmp.pfam.* > ${proteins_fasta%.*}.pfam.domtblout
-    exit_code=$?
-    if [[ $exit_code -ne 0 ]]
-    then
-        echo "Concatenating split outputs failed! Aborting!" >&2
-        exit $exit_code
-    fi
-
-    echo "$(date +%F_%T) - Deleting tmp files now..."
-    rm $tmp_dir/tmp.*
+    split_domtblouts=$(ls $tmp_dir/tmp.pfam.*.domtblout | paste -sd ',')
 else
     echo "$(date +%F_%T) - Calling hmmsearch to predict Pfams now..."
     hmmsearch_cmd="hmmsearch --notextw --cut_tc"
@@ -118,16 +109,29 @@ tool_and_version=${tool_and_version:2}
 
 echo "$(date +%F_%T) - Executing clan filtering and transforming to GFF now..."
 pfams_gff=${proteins_fasta%_*}_pfam.gff
-grep -v '^#' ${proteins_fasta%.*}.pfam.domtblout | \
-awk '{print $1,$4,$5,$6,13,$14,$16,$17,$20,$21}' | \
-sort -k1,1 -k6,6nr -k5,5n | \
-$(dirname $0)/pfam_clan_filter.py "$tool_and_version" \
-	$pfam_claninfo_tsv > $pfams_gff
+$(dirname $0)/hmmsearch_post_processor.py -c $pfam_claninfo_tsv \
+										  -p ${split_domtblouts:-${proteins_fasta%.*}.pfam.domtblout} $pfams_gff \
+										  "$tool_and_version"
 exit_code=$?
 if [[ $exit_code -ne 0 ]]
 then
-	echo "$(date +%F_%T) - The pipe command failed! Aborting!" >&2
+	echo "$(date +%F_%T) - The post-processing failed! Aborting!" >&2
 	exit $exit_code
 fi
 
+if [[ ! -z "$split_domtblouts" ]]
+then
+    echo "$(date +%F_%T) - Concatenating split result files now..."
+    cat $tmp_dir/tmp.pfam.* > ${proteins_fasta%.*}.pfam.domtblout
+    exit_code=$?
+    if [[ $exit_code -ne 0 ]]
+    then
+        echo "Concatenating split outputs failed! Aborting!" >&2
+        exit $exit_code
+    fi
+
+    echo "$(date +%F_%T) - Deleting tmp files now..."
+    rm $tmp_dir/tmp.*
+fi
+
 echo "$(date +%F_%T) - Done with Pfam annotation."
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+import hmmsearch_fragmented_hits_filter
+import hmmsearch_hit_selector
+import pfam_clan_filter
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input, open_output
+
+
+parser = argparse.ArgumentParser(description="""This script post-processes
+the domtblout outputs of hmmsearch runs against one or more databases and
+writes the filtered hits of each database to its own GFF file. It replaces the
+'grep | awk | sort | filter' pipelines: the domtblout gets read directly, the
+hits get grouped by gene in memory (in the same order 'sort' would create in
+the C locale, spilling sorted runs to tmp files for very large inputs) and the
+filter strategy of the database gets applied per gene: the fragmented hits
+filter (SMART, COG, SuperFamily, Cath-FunFam), the hit selector (TIGRFAM) or
+the Pfam clan filter. The databases get processed concurrently if more than
+one job is allowed. The domtblouts can be gzip or zstd compressed and GFFs
+ending with .gz or .zst get written compressed.
+Instead of a single domtblout the outputs of hmmsearch runs on splits of the
+proteins FASTA can be given as a comma separated list. They get merged while
+they are read, so they don't need to get concatenated first.""",
+formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("hmmer_version", metavar="hmmer_version",
+                    help="hmmer version used to create the domtblouts")
+parser.add_argument("-f", "--fragmented_hits_filter", nargs=2,
+                    metavar=("domtblout", "gff"), action="append", default=[],
+                    help="""domtblout to run through the fragmented hits filter
+                    and GFF to write the hits to (can be given multiple
+                    times)""")
+parser.add_argument("-s", "--hit_selector", nargs=2,
+                    metavar=("domtblout", "gff"), action="append", default=[],
+                    help="""domtblout to run through the hit selector and GFF
+                    to write the hits to (can be given multiple times)""")
+parser.add_argument("-p", "--pfam_clan_filter", nargs=2,
+                    metavar=("domtblout", "gff"), action="append", default=[],
+                    help="""domtblout to run through the Pfam clan filter and
+                    GFF to write the hits to (can be given multiple times)""")
+parser.add_argument("-c", "--clan_info_file", help="""the full path to the
+                    Pfam clan info file (required for the Pfam clan
+                    filter)""")
+parser.add_argument("-a", "--aln_len_ratio", nargs="?",
+                    metavar="min_aln_len_ratio", dest="min_aln_len_ratio",
+                    type=float, default=0.7,
+                    help="""the minimum required alignment length ratio on the
+                    shorter gene/model (fragmented hits filter and hit
+                    selector)""")
+parser.add_argument("-o", "--overlap_ratio", nargs="?",
+                    metavar="max_overlap_ratio", dest="max_overlap_ratio",
+                    type=float, default=0.10, help="""the maximum allowed
+                    overlap ratio on the shorter hit (fragmented hits filter
+                    and hit selector)""")
+parser.add_argument("-m", "--max_hits_in_memory", type=int, default=2000000,
+                    help="""maximum number of hits to sort in memory per
+                    domtblout (more hits get sorted in runs that are
+                    written to tmp files and merged)""")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="number of domtblouts to process in parallel")
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s 1.1.0")
+
+
+def post_process(task):
+    strategy, domtblout, gff, args = task
+    split_domtblouts = []
+    try:
+        try:
+            for path in domtblout.split(","):
+                split_domtblouts.append(open_input(path))
+            with Gff_Writer(open_output(gff)) as gff_writer:
+                if strategy == "fragmented_hits_filter":
+                    hmmsearch_fragmented_hits_filter.filter_domtblouts(
+                        split_domtblouts, args.hmmer_version, gff_writer,
+                        args.min_aln_len_ratio, args.max_overlap_ratio,
+                        args.max_hits_in_memory)
+                elif strategy == "hit_selector":
+                    hmmsearch_hit_selector.filter_domtblouts(
+                        split_domtblouts, args.hmmer_version,
+                        args.min_aln_len_ratio, args.max_overlap_ratio,
+                        gff_writer, args.max_hits_in_memory)
+                else:
+                    with open_input(args.clan_info_file) as clan_info_file:
+                        clan_lookup = pfam_clan_filter.create_clan_lookup(
+                                          clan_info_file)
+                    pfam_clan_filter.filter_domtblouts(split_domtblouts,
+                                                       args.hmmer_version,
+                                                       clan_lookup, gff_writer,
+                                                       args.max_hits_in_memory)
+        finally:
+            for split_domtblout in split_domtblouts:
+                split_domtblout.close()
+    except SystemExit as e:
+        """The filters exit on invalid input, which must not take down a
+        pool worker."""
+        return domtblout, e.code
+    except (ValueError, OSError) as e:
+        """Unparsable lines, a missing decompressor or a failed (de)compression
+        process."""
+        print(str(e), file=sys.stderr)
+        return domtblout, 1
+    return domtblout, 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    tasks = []
+    for strategy in ("fragmented_hits_filter", "hit_selector",
+                     "pfam_clan_filter"):
+        for domtblout, gff in getattr(args, strategy):
+            tasks.append((strategy, domtblout, gff, args))
+    if args.pfam_clan_filter and not args.clan_info_file:
+        parser.error("the Pfam clan filter needs the clan info file (-c)")
+
+    if args.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.get_context("fork").Pool(
+                   min(args.jobs, len(tasks)))
+        results = pool.imap_unordered(post_process, tasks)
+    else:
+        pool = None
+        results = map(post_process, tasks)
+    for domtblout, exit_code in results:
+        if exit_code:
+            print("Post-processing " + domtblout + " failed! Aborting!",
+                  file=sys.stderr)
+            if pool is not None:
+                pool.terminate()
+            sys.exit(exit_code)
+    if pool is not None:
+        pool.close()
+        pool.join()
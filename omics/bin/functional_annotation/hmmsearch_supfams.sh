@@ -64,6 +64,7 @@ then
 fi
 
 
+split_domtblouts=""
 if [[ $number_of_additional_threads -gt $number_of_parallel_hmmsearch_instances ]]
 then
     hmmsearch_threads=$(echo $number_of_additional_threads / $number_of_parallel_hmmsearch_instances | bc)
@@ -95,17 +96,7 @@ then
         exit $exit_code
     fi
 
-    echo "$(date +%F_%T) - Concatenating split result files now..."
-    cat $tmp_dir/tmp.supfam.* > ${proteins_fasta%.*}.supfam.domtblout
-    exit_code=$?
-    if [[ $exit_code -ne 0 ]]
-    then
-        echo "Concatenating split outputs failed! Aborting!" >&2
-        exit $exit_code
-    fi
-
-#    echo "$(date +%F_%T) - Deleting tmp files now..."
-#    rm $tmp_dir/tmp.*
+    split_domtblouts=$(ls $tmp_dir/tmp.supfam.*.domtblout | paste -sd ',')
 else
     echo "$(date +%F_%T) - Calling hmmsearch against the SuperFamily db now..."
     hmmsearch_cmd="hmmsearch --notextw --domE $min_domain_evalue_cutoff"
@@ -131,17 +122,30 @@ tool_and_version=${tool_and_version:2}
 
 echo "$(date +%F_%T) - Filtering fragments and converting output to gff now..."
 supfam_gff=${proteins_fasta%_*}_supfam.gff
-grep -v '^#' ${proteins_fasta%.*}.supfam.domtblout | \
-awk '{print $1,$3,$4,$5,$6,$7,$8,$13,$14,$16,$17,$20,$21}' | \
-sort -k1,1 -k7,7nr -k6,6n | \
-$(dirname $0)/hmmsearch_fragmented_hits_filter.py -a $min_aln_length_ratio \
-												  -o $max_overlap_ratio \
-											"$tool_and_version" > $supfam_gff
+$(dirname $0)/hmmsearch_post_processor.py -a $min_aln_length_ratio \
+										  -o $max_overlap_ratio \
+										  -f ${split_domtblouts:-${proteins_fasta%.*}.supfam.domtblout} $supfam_gff \
+										  "$tool_and_version"
 exit_code=$?
 if [[ $exit_code -ne 0 ]]
 then
-	echo "$(date +%F_%T) - One of the pipe commands failed! Aborting!" >&2
+	echo "$(date +%F_%T) - The post-processing failed! Aborting!" >&2
 	exit $exit_code
 fi
 
+if [[ ! -z "$split_domtblouts" ]]
+then
+    echo "$(date +%F_%T) - Concatenating split result files now..."
+    cat $tmp_dir/tmp.supfam.* > ${proteins_fasta%.*}.supfam.domtblout
+    exit_code=$?
+    if [[ $exit_code -ne 0 ]]
+    then
+        echo "Concatenating split outputs failed! Aborting!" >&2
+        exit $exit_code
+    fi
+
+#    echo "$(date +%F_%T) - Deleting tmp files now..."
+#    rm $tmp_dir/tmp.*
+fi
+
 echo "$(date +%F_%T) - Done with SuperFamily annotation."
@@ -57,6 +57,7 @@ then
 fi
 
 
+split_domtblouts=""
 if [[ $number_of_additional_threads -gt $number_of_parallel_hmmsearch_instances ]]
 then
     hmmsearch_threads=$(echo $number_of_additional_threads / $number_of_parallel_hmmsearch_instances | bc)
@@ -88,17 +89,7 @@ then
         exit $exit_code
     fi
 
-    echo "$(date +%F_%T) - Concatenating split result files now..."
-    cat $tmp_dir/tmp.tigrfam.* > ${proteins_fasta%.*}.tigrfam.domtblout
-    exit_code=$?
-    if [[ $exit_code -ne 0 ]]
-    then
-        echo "Concatenating split outputs failed! Aborting!" >&2
-        exit $exit_code
-    fi
-
-    echo "$(date +%F_%T) - Deleting tmp files now..."
-    rm $tmp_dir/tmp.*
+    split_domtblouts=$(ls $tmp_dir/tmp.tigrfam.*.domtblout | paste -sd ',')
 else
     echo "$(date +%F_%T) - Calling hmmsearch to predict TIGRFAMs now..."
     hmmsearch_cmd="hmmsearch --notextw --cut_nc"
@@ -124,17 +115,30 @@ tool_and_version=${tool_and_version:2}
 
 echo "$(date +%F_%T) - Sort, filter and select TIGRFAMs now..."
 tigrfams_gff=${proteins_fasta%_*}_tigrfam.gff
-grep -v '^#' ${proteins_fasta%.*}.tigrfam.domtblout | \
-awk '{print $1,$3,$4,$6,$13,$14,$16,$17,$20,$21}' | \
-sort -k1,1 -k6,6nr -k5,5n | \
-$(dirname $0)/hmmsearch_hit_selector.py -a $min_aln_length_ratio \
-										-o $max_overlap_ratio \
-										"$hmmer_version" 1> $tigrfams_gff
+$(dirname $0)/hmmsearch_post_processor.py -a $min_aln_length_ratio \
+										  -o $max_overlap_ratio \
+										  -s ${split_domtblouts:-${proteins_fasta%.*}.tigrfam.domtblout} $tigrfams_gff \
+										  "$hmmer_version"
 exit_code=$?
 if [[ $exit_code -ne 0 ]]
 then
-	echo "$(date +%F_%T) - One of the pipe commands failed! Aborting!" >&2
+	echo "$(date +%F_%T) - The post-processing failed! Aborting!" >&2
 	exit $exit_code
 fi
 
+if [[ ! -z "$split_domtblouts" ]]
+then
+    echo "$(date +%F_%T) - Concatenating split result files now..."
+    cat $tmp_dir/tmp.tigrfam.* > ${proteins_fasta%.*}.tigrfam.domtblout
+    exit_code=$?
+    if [[ $exit_code -ne 0 ]]
+    then
+        echo "Concatenating split outputs failed! Aborting!" >&2
+        exit $exit_code
+    fi
+
+    echo "$(date +%F_%T) - Deleting tmp files now..."
+    rm $tmp_dir/tmp.*
+fi
+
 echo "$(date +%F_%T) - Done with TIGRFAM annotation."
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from datetime import datetime
+
+
+"""
+    Binary index layout (all integers little endian):
+
+    header:  magic (8 bytes), format version (uint32), number of entries
+             (uint64)
+    entries: one fixed size record per MD5 hash, sorted by the 16 byte MD5
+             digest, pointing into the values blob (offset uint64, length
+             uint32)
+    values:  the remaining tab-delimited columns of the MD5 mapping file
+             (gene_ids, ko_ids, ec_ids, taxon_id) for each MD5 hash
+"""
+MAGIC = b"IMGNRMD5"
+VERSION = 1
+HEADER = struct.Struct("<8sIQ")
+ENTRY = struct.Struct("<16sQI")
+DIGEST_LENGTH = 16
+
+
+
+def is_md5_index(file_path):
+    with open(file_path, "rb") as fr:
+        return fr.read(len(MAGIC)) == MAGIC
+
+
+
+def compile_index(md5_mapping_file, index_file):
+    print(str(datetime.now()) + " - Reading MD5 mapping file...")
+    entries = []
+    """Write the values into a tmp file next to the index first, since the
+    size of the entries table is only known after all lines got read."""
+    index_dir = os.path.dirname(os.path.abspath(index_file))
+    with tempfile.TemporaryFile(dir=index_dir) as values_fh:
+        offset = 0
+        with open(md5_mapping_file, "rb") as fr:
+            for line in fr:
+                line = line.rstrip()
+                if not line:
+                    continue
+                md5_hash, values = line.split(b"\t", 1)
+                try:
+                    digest = bytes.fromhex(md5_hash.decode("ascii"))
+                except ValueError:
+                    digest = b""
+                if len(digest) != DIGEST_LENGTH:
+                    print("Not a valid MD5 hash: " +
+                          md5_hash.decode("ascii", "replace") + "\nAborting!",
+                          file=sys.stderr)
+                    sys.exit(1)
+                entries.append(ENTRY.pack(digest, offset, len(values)))
+                values_fh.write(values)
+                offset += len(values)
+
+        print(str(datetime.now()) + " - Sorting " + str(len(entries)) +
+              " entries...")
+        """The sort is stable, so for duplicated MD5 hashes the last line in
+        the mapping file wins (same as for the dictionary lookup)."""
+        entries.sort(key=lambda entry: entry[:DIGEST_LENGTH])
+        unique_entries = []
+        for i in range(len(entries)):
+            if (i + 1 < len(entries) and
+                    entries[i][:DIGEST_LENGTH] == entries[i+1][:DIGEST_LENGTH]):
+                continue
+            unique_entries.append(entries[i])
+        entries = None
+
+        print(str(datetime.now()) + " - Writing index...")
+        tmp_index_file = index_file + ".tmp_" + str(os.getpid())
+        with open(tmp_index_file, "wb") as fw:
+            fw.write(HEADER.pack(MAGIC, VERSION, len(unique_entries)))
+            fw.write(b"".join(unique_entries))
+            values_fh.seek(0)
+            shutil.copyfileobj(values_fh, fw, 16 * 1024 * 1024)
+        os.replace(tmp_index_file, index_file)
+    print(str(datetime.now()) + " - Done.")
+
+
+
+class MD5_Index:
+    """Read-only, memory mapped view of a compiled MD5 mapping. Supports the
+    same lookups the selector does on the dictionary created from the MD5
+    mapping file, but only decodes the entries that actually get requested."""
+    def __init__(self, index_file):
+        self.fh = open(index_file, "rb")
+        self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(index_file + " is not a compatible MD5 index " +
+                             "(version " + str(version) + ")")
+        self.entries_start = HEADER.size
+        self.values_start = self.entries_start + self.size * ENTRY.size
+        self.cache = {}
+
+
+    def find_entry(self, digest):
+        low = 0
+        high = self.size
+        while low < high:
+            middle = (low + high) // 2
+            pos = self.entries_start + middle * ENTRY.size
+            middle_digest = self.mm[pos:pos+DIGEST_LENGTH]
+            if middle_digest < digest:
+                low = middle + 1
+            elif middle_digest > digest:
+                high = middle
+            else:
+                return pos
+        return -1
+
+
+    def get(self, md5_hash):
+        if md5_hash in self.cache:
+            return self.cache[md5_hash]
+        try:
+            digest = bytes.fromhex(md5_hash)
+        except ValueError:
+            return None
+        pos = self.find_entry(digest)
+        if pos < 0:
+            return None
+        ignore, offset, length = ENTRY.unpack_from(self.mm, pos)
+        start = self.values_start + offset
+        values = self.mm[start:start+length].decode("utf-8").split("\t")
+        entry = {}
+        entry["gene_ids"] = values[0].split(":")
+        if values[1] != "N/A":
+            entry["ko_ids"] = values[1]
+        if values[2] != "N/A":
+            entry["ec_ids"] = values[2]
+        entry["taxon_id"] = values[3]
+        self.cache[md5_hash] = entry
+        return entry
+
+
+    def __contains__(self, md5_hash):
+        return self.get(md5_hash) is not None
+
+
+    def __getitem__(self, md5_hash):
+        entry = self.get(md5_hash)
+        if entry is None:
+            raise KeyError(md5_hash)
+        return entry
+
+
+    def __len__(self):
+        return self.size
+
+
+    def close(self):
+        self.mm.close()
+        self.fh.close()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="""This script compiles the
+                                     IMG NR MD5 mapping file (MD5 hash,
+                                     gene_ids, ko_ids, ec_ids and taxon_id
+                                     per line) into a sorted binary index.
+                                     The index only needs to get created once
+                                     per IMG NR release and can then be given
+                                     to
+                                     lastal_img_nr_ko_ec_gene_phylo_hit_selector.py
+                                     instead of the MD5 mapping file. The
+                                     selector memory maps it and only looks up
+                                     the MD5 hashes of the hits it sees.""",
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("md5_mapping_file",
+                        help="filepath to the MD5 mapping file")
+    parser.add_argument("index_file",
+                        help="filepath to write the compiled index to")
+    parser.add_argument("-v", "--version", action="version",
+                        version="%(prog)s 1.0.0")
+    args = parser.parse_args()
+
+    compile_index(args.md5_mapping_file, args.index_file)
@@ -5,6 +5,12 @@ import sys
 import argparse
 import fileinput
 from datetime import datetime
+from img_nr_md5_index import MD5_Index, is_md5_index
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.records import Record, UNSET
+from imgap.compressed_io import input_file_type, output_file_type, open_input
 
 parser = argparse.ArgumentParser(description="""This script expects to get to
                                  get the blasttab+ output from a lastal run the
@@ -34,24 +40,33 @@ parser = argparse.ArgumentParser(description="""This script expects to get to
                                  gene length are covered (calculated based on
                                  reported coordinates for each) for isolate
                                  projects and 70% of the shorter gene's length
-                                 for metagenomes.""",
+                                 for metagenomes.
+                                 Instead of the MD5 mapping file, an index
+                                 compiled from it with img_nr_md5_index.py can
+                                 be provided. It gets memory mapped and only
+                                 the MD5 hashes of the hits get looked up.
+                                 Without such an index and if the blasttab+
+                                 output is seekable (a file, not a pipe), it
+                                 gets scanned twice to only load the MD5
+                                 mapping entries of the considered hits.""",
 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument("project_type", choices=["isolate", "metagenome"],
                     help="either 'isolate' or 'metagenome'")
-parser.add_argument("md5_mapping_file", type=argparse.FileType('r'),
-                    help="filepath to the MD5 mapping file")
-parser.add_argument("phylo_mapping_file", type=argparse.FileType('r'),
+parser.add_argument("md5_mapping_file",
+                    help="""filepath to the MD5 mapping file (or to the index
+                    compiled from it)""")
+parser.add_argument("phylo_mapping_file", type=input_file_type,
                     help="filepath to the phylogeny mapping")
-parser.add_argument("ko_output_file", type=argparse.FileType('w'),
+parser.add_argument("ko_output_file", type=output_file_type,
                     help="filepath to to the KO output file")
-parser.add_argument("ec_output_file", type=argparse.FileType('w'),
+parser.add_argument("ec_output_file", type=output_file_type,
                     help="filepath to the EC output file")
-parser.add_argument("phylo_output_file", type=argparse.FileType('w'),
+parser.add_argument("phylo_output_file", type=output_file_type,
                     help="filepath to the phylo output file")
-parser.add_argument("ko_ec_gff_output_file", type=argparse.FileType('w'),
+parser.add_argument("ko_ec_gff_output_file", type=output_file_type,
                     help="filepath to the KO/EC GFF output file")
 parser.add_argument("last_blasttabplus_file", nargs='?',
-                    type=argparse.FileType('r'), default=sys.stdin,
+                    type=input_file_type, default=sys.stdin,
                     help="""file path to the blasttab+ output (can also be
                     provided via STDIN)""")
 parser.add_argument("-l", "--aln_len_ratio", metavar="aln_len_ratio",
@@ -65,11 +80,16 @@ parser.add_argument("-n", "--number_of_top_hits", metavar="number_of_top_hits",
                     type=int, default=5,
                     help="number of top hits to look at")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
+                    version="%(prog)s 1.2.0")
 args, input = parser.parse_known_args()
 
 
-class Hit:
+class Hit(Record):
+    __slots__ = ("query_gene", "subject_gene", "percent_id",
+                 "query_gene_start", "query_gene_end", "subject_gene_start",
+                 "subject_gene_end", "evalue", "bitscore", "query_gene_len",
+                 "subject_gene_len", "ko_ids", "alignment_length")
+
     def __init__(self, hit_fields):
         self.query_gene = hit_fields[0]
         self.subject_gene = hit_fields[1]
@@ -82,10 +102,12 @@ class Hit:
         self.bitscore = hit_fields[11]
         self.query_gene_len = int(hit_fields[12])
         self.subject_gene_len = int(hit_fields[13])
+        self.ko_ids = UNSET
+        self.alignment_length = None
 
 
     def has_ko(self, md5_lookup):
-        if not hasattr(self, "ko_ids"):
+        if self.ko_ids is UNSET:
             if "ko_ids" in md5_lookup[self.subject_gene]:
                 self.ko_ids = md5_lookup[self.subject_gene]["ko_ids"]
             else:
@@ -171,10 +193,43 @@ class Hit:
 
 
 
+def get_subject_md5s():
+    """Pre-scan of the blasttab+ output, collecting the subjects of all hits
+    the selection below will look at (top hits per gene). Only possible if the
+    input is seekable, otherwise None gets returned."""
+    blasttab_file = args.last_blasttabplus_file
+    if not blasttab_file.seekable():
+        return None
+    print(str(datetime.now()) + " - Collecting subject MD5s of top hits...")
+    subject_md5s = set()
+    current_gene = ""
+    hit_counter = 0
+    for line in blasttab_file:
+        if line.startswith("#"):
+            continue
+        query_gene, subject_gene = line.split(None, 2)[:2]
+        if query_gene != current_gene:
+            current_gene = query_gene
+            hit_counter = 0
+        hit_counter += 1
+        if hit_counter == 1 or hit_counter <= args.number_of_top_hits:
+            subject_md5s.add(subject_gene)
+    blasttab_file.seek(0)
+
+    return subject_md5s
+
+
 def create_md5_lookup():
+    if is_md5_index(args.md5_mapping_file):
+        print(str(datetime.now()) + " - Opening MD5 index...")
+        return MD5_Index(args.md5_mapping_file)
+    subject_md5s = get_subject_md5s()
     print(str(datetime.now()) + " - Creating MD5 lookup...")
     md5_lookup = {}
-    for line in args.md5_mapping_file:
+    for line in open_input(args.md5_mapping_file):
+        if (subject_md5s is not None and
+                line[:line.find("\t")] not in subject_md5s):
+            continue
         line_split = line.rstrip().split("\t")
         md5_hash = line_split[0]
         md5_lookup[md5_hash] = {}
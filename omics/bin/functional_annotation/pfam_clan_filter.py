@@ -2,6 +2,17 @@
 
 import argparse
 import fileinput
+import os
+import sys
+from operator import itemgetter
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.hmmer_tables import (read_domtblout, open_tables,
+                                get_merged_hits_by_target)
+from imgap.intervals import remove_group_overlaps
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input, input_file_type
 
 
 parser = argparse.ArgumentParser(description="""This script expects to get
@@ -12,103 +23,119 @@ As arguments it needs the hmmsearch version used (for the GFF output) and the
 Pfam claninfo file that can get downloaded together with the database.
 For all hits of a gene the script then checks if two hits overlap and if so
 additionally checks if the two hits belong to the same class. If that's the
-case the lower scoring hit gets removed.""")
+case the lower scoring hit gets removed.
+With --domtblout the input is the domtblout itself, as written by hmmsearch,
+and the columns get selected and sorted by the script. Several domtblouts (e.g.
+of hmmsearch runs on splits of the proteins FASTA) get merged.""")
 parser.add_argument("hmmsearch_version", help="""hmmsearch version used to
                     create the input""")
-parser.add_argument("clan_info_file", type=argparse.FileType('r'),
+parser.add_argument("clan_info_file", type=input_file_type,
                     help="""the full path to the clan info file""")
+parser.add_argument("-d", "--domtblout", action="store_true",
+                    help="""the input is an unsorted domtblout instead of the
+                    selected and sorted columns""")
+parser.add_argument("-m", "--max_hits_in_memory", type=int, default=2000000,
+                    help="""maximum number of hits to sort in memory with
+                    --domtblout (more hits get sorted in runs that are
+                    written to tmp files and merged)""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
-args, input = parser.parse_known_args()
+                    version="%(prog)s 1.1.1")
 
 
-clan_lookup = {}
+"""The domtblout columns the script expects, in the expected order."""
+DOMTBLOUT_ATTRIBUTES = ("target_name", "query_name", "query_accession",
+                        "query_length", "domain_i_evalue", "domain_bitscore",
+                        "hmm_start", "hmm_end", "env_start", "env_end")
 
 
-def create_clan_lookup():
-    for line in args.clan_info_file:
+def create_clan_lookup(clan_info_file):
+    clan_lookup = {}
+    for line in clan_info_file:
         pfam, clan, rest = line.rstrip().split("\t", 2)
         if not clan:
             continue
         clan_lookup[pfam] = clan
+    return clan_lookup
 
 
-def get_overlap_length(hit_a, hit_b):
-    # First check if the overlaps overlap at all
-    if hit_a[8] > hit_b[9] or hit_a[9] < hit_b[8]:
-        return 0
-
-    overlap_start = max(hit_a[8], hit_b[8])
-    overlap_end = min(hit_a[9], hit_b[9])
-    return overlap_end - overlap_start + 1
+def remove_clan_overlaps(gene_hits, clan_lookup):
+    """Keeps the hits (sorted by bitscore and evalue) unless they overlap a
+    better hit of the same clan."""
+    return remove_group_overlaps(gene_hits,
+                                 lambda hit: clan_lookup.get(hit[2]),
+                                 itemgetter(8, 9))
 
 
-def remove_clan_overlaps(gene_hits):
-    if not gene_hits:
-        return gene_hits
+def output_in_gff(gene_hits, hmmsearch_version, gff_writer):
+    for hit in gene_hits:
+        fake_percent_id = ((hit[7] - hit[6] + 1) / hit[3]) * 100
+        alignment_length = hit[9] - hit[8] + 1
+        gff_writer.write_row(
+            hit[0], hmmsearch_version, hit[2], str(hit[8]), str(hit[9]),
+            hit[5], ".", ".",
+            "ID=%s_%d_%d;Name=%s;fake_percent_id=%.2f;alignment_length=%d;"
+            "e-value=%s;model_start=%d;model_end=%d" % (
+                hit[0], hit[8], hit[9], hit[1], fake_percent_id,
+                alignment_length, hit[4], hit[6], hit[7]))
 
-    ignore = set()
-    for i in range(0, len(gene_hits)-1):
-        if i not in ignore:
-            for j in range(i+1, len(gene_hits)):
-                if j not in ignore:
-                    if (get_overlap_length(gene_hits[i], gene_hits[j]) > 0
-                            and gene_hits[i][2] in clan_lookup
-                            and gene_hits[j][2] in clan_lookup
-                            and clan_lookup[gene_hits[i][2]] == clan_lookup[gene_hits[j][2]]):
-                        ignore.add(j)
-    cleaned_gene_hits = [gene_hits[0]]
-    for i in range(1, len(gene_hits)):
-        if i not in ignore:
-            cleaned_gene_hits.append(gene_hits[i])
 
-    return cleaned_gene_hits
+def trim_accession(fields):
+    # Remove the version from the accession
+    fields[2] = fields[2][:fields[2].find(".")]
+    return fields
 
 
-def output_in_gff(gene_hits):
-    for hit in gene_hits:
-        fake_percent_id = ((fields[7] - fields[6] + 1) / fields[3]) * 100
-        alignment_length = hit[9] - hit[8] + 1
-        print(hit[0] + "\t" +
-              args.hmmsearch_version + "\t" +
-              hit[2] + "\t" +
-              str(hit[8]) + "\t" +
-              str(hit[9]) + "\t" +
-              hit[5] + "\t" +
-              ".\t.\t" +
-              "ID=" + hit[0] + "_" + str(hit[8]) + "_" + str(hit[9]) +
-              ";Name=" + hit[1] +
-              ";fake_percent_id=" + str("%.2f" % fake_percent_id) +
-              ";alignment_length=" + str(alignment_length) +
-              ";e-value=" + hit[4] +
-              ";model_start=" + str(hit[6]) +
-              ";model_end=" + str(hit[7]))
-
-
-
-create_clan_lookup()
-current_gene = ""
-gene_hits = []
-# Run over stdin
-for line in fileinput.input(input):
+def get_hit_fields(fields):
     # fields: gene, model, accession, model_len, evalue,
     #         bitscore, hmm_start, hmm_stop, env_start, env_stop
-    fields = line.rstrip().split()
-    fields[2] = fields[2][:fields[2].find(".")]
+    trim_accession(fields)
     fields[3] = int(fields[3])
     fields[6] = int(fields[6])
     fields[7] = int(fields[7])
     fields[8] = int(fields[8])
     fields[9] = int(fields[9])
-
-    if fields[0] != current_gene:
-        # Now we look at the hits for a new gene
-        gene_hits = remove_clan_overlaps(gene_hits)
-        output_in_gff(gene_hits)
-        gene_hits = []
-        current_gene = fields[0]
-
-    gene_hits.append(fields)
-
-gene_hits = remove_clan_overlaps(gene_hits)
-output_in_gff(gene_hits)
+    return fields
+
+
+def filter_domtblouts(domtblouts, hmmsearch_version, clan_lookup, gff_writer,
+                      max_hits_in_memory=None):
+    hit_streams = [read_domtblout(domtblout) for domtblout in domtblouts]
+    for gene, gene_hits in get_merged_hits_by_target(hit_streams,
+                                                     DOMTBLOUT_ATTRIBUTES,
+                                                     "domain_bitscore",
+                                                     "domain_i_evalue",
+                                                     max_hits_in_memory):
+        gene_hits = [trim_accession(fields) for fields in gene_hits]
+        gene_hits = remove_clan_overlaps(gene_hits, clan_lookup)
+        output_in_gff(gene_hits, hmmsearch_version, gff_writer)
+
+
+if __name__ == "__main__":
+    args, input = parser.parse_known_args()
+
+    clan_lookup = create_clan_lookup(args.clan_info_file)
+    gff_writer = Gff_Writer()
+    if args.domtblout:
+        filter_domtblouts(open_tables(input), args.hmmsearch_version,
+                          clan_lookup, gff_writer, args.max_hits_in_memory)
+        gff_writer.flush()
+        sys.exit(0)
+
+    current_gene = ""
+    gene_hits = []
+    # Run over stdin
+    for line in fileinput.input(input, openhook=open_input):
+        fields = get_hit_fields(line.rstrip().split())
+
+        if fields[0] != current_gene:
+            # Now we look at the hits for a new gene
+            gene_hits = remove_clan_overlaps(gene_hits, clan_lookup)
+            output_in_gff(gene_hits, args.hmmsearch_version, gff_writer)
+            gene_hits = []
+            current_gene = fields[0]
+
+        gene_hits.append(fields)
+
+    gene_hits = remove_clan_overlaps(gene_hits, clan_lookup)
+    output_in_gff(gene_hits, args.hmmsearch_version, gff_writer)
+    gff_writer.flush()
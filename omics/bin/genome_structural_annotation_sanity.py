@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
 import argparse
-import fileinput
+import sys
 from os.path import dirname
 
+from imgap.fasta_index import Fasta_Index
+from imgap.intervals import get_union_length
+from imgap.compressed_io import open_input
+from imgap.gff_columns import Gff_Columns
+
 
 parser = argparse.ArgumentParser(description="""This script calculates the
                                  coding density and checks the length of the
@@ -24,7 +29,6 @@ parser.add_argument("contigs_fasta",
                     help="""path to the input fasta file containing the
                     nucleotide sequences""")
 parser.add_argument("structural_annotation_gff",
-                    type=argparse.FileType('r'),
                     help="""path to the gff file containing the structural
                     annotations for the contigs in contigs_fasta""")
 parser.add_argument("-g", "--gap_len_cutoff",
@@ -43,52 +47,67 @@ parser.add_argument("-u", "--upper_coding_density_cutoff",
                     type=float, default=1.0,
                     help="""determines the maximum allowed coding density
                     percentage""")
+parser.add_argument("-c", "--gff_columns",
+                    help="""path to the binary columns of the gff file
+                    (written by gff_files_merger.py), to load instead of
+                    parsing the gff file""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
+                    version="%(prog)s 1.1.0")
 args = parser.parse_args()
 
 
-"""This script will only be executed for genomes. Since their sizes will only
-be a few MB, we'll keep their sequences in memory for easy lookup of the
-intergenic regions (to check how many Ns they contain)."""
+"""Instead of the sequences, only their lengths and the location of the N
+stretches (to check how many Ns the intergenic regions contain) get kept in
+memory."""
 
 def create_seq_lookup():
-    lookup = {}
-    contigs_fasta_fh = open(args.contigs_fasta, 'r')
-    for line in contigs_fasta_fh:
-        line = line.rstrip()
-        if not line:
-            continue
-        if line.startswith(">"):
-            seq_name = line[1:]
-            lookup[seq_name] = ""
-        else:
-            lookup[seq_name] += line
-    contigs_fasta_fh.close()
-    return lookup
+    return Fasta_Index(args.contigs_fasta, args.gap_n_stretch_cutoff)
 
 
 
 def initialize_coding_bp_tracker_and_return_total_bp(coding_bp_tracker,
                                                      seq_lookup):
     total_bp = 0
-    for seq_name, seq in seq_lookup.items():
-        seq_len = len(seq)
-        total_bp += seq_len
-        coding_bp_tracker[seq_name] = [0] * seq_len
+    for record in seq_lookup:
+        total_bp += record.length
+        coding_bp_tracker[record.name] = []
     return total_bp
 
 
 
 def gap_has_not_too_many_ns(seq_lookup, seq_name,
-                            gap_start, gap_stop, n_stretch):
-    intergenic_region = seq_lookup[seq_name][gap_start-1:gap_stop]
-    if intergenic_region.find(n_stretch) >= 0:
+                            gap_start, gap_stop, n_stretch_length):
+    if seq_lookup.has_n_stretch(seq_name, gap_start, gap_stop,
+                                n_stretch_length):
         return False
     return True
 
 
 
+def read_gene_coordinates():
+    """Yields the sequence name, start and stop of all genes that aren't
+    children of another feature, from the gff or its binary columns."""
+    if args.gff_columns:
+        try:
+            gff_columns = Gff_Columns.load(args.gff_columns,
+                                           args.structural_annotation_gff)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            sys.exit(1)
+        for (seq_name, source, feature_type, start, end, strand, gene_id,
+             shortened_info, has_parent) in gff_columns.get_rows():
+            if not has_parent:
+                yield seq_name, start, end
+        return
+    with open_input(args.structural_annotation_gff) as fr:
+        for line in fr:
+            fields = line.split("\t")
+            if "Parent=" in fields[8]:
+                continue
+            yield fields[0], int(fields[3]), int(fields[4])
+
+
+
 def write_to_qc_needed_file(reason):
     global qc_needed_fh
     if not qc_needed_fh:
@@ -106,42 +125,42 @@ seq_lookup = create_seq_lookup()
 coding_bp_tracker = {}
 total_bp = initialize_coding_bp_tracker_and_return_total_bp(coding_bp_tracker,
                                                             seq_lookup)
-n_stretch = "N" * args.gap_n_stretch_cutoff
 total_coding_bp = 0
 previous_gene_stop = 0
 big_gaps_count = 0
 seq_name = ""
-for line in args.structural_annotation_gff:
-    fields = line.split("\t")
-    if "Parent=" in fields[8]:
-        continue
-    if fields[0] != seq_name:
+for gene_seq_name, gene_start, gene_stop in read_gene_coordinates():
+    if gene_seq_name != seq_name:
         previous_gene_stop = 0
-        seq_name = fields[0]
-    gene_start = int(fields[3])
-    gene_stop = int(fields[4])
-    for index in range(gene_start-1, gene_stop):
-        coding_bp_tracker[seq_name][index] = 1
+        seq_name = gene_seq_name
+    if gene_stop > seq_lookup.get_length(seq_name):
+        print("Off-contig coordinate (" +
+              str(max(gene_start, seq_lookup.get_length(seq_name) + 1)) + ") on " +
+              seq_name +
+              " (length: " + str(seq_lookup.get_length(seq_name)) + ")! Aborting!",
+              file=sys.stderr)
+        sys.exit(1)
+    coding_bp_tracker[seq_name].append((gene_start, gene_stop))
     if gene_stop < previous_gene_stop:
         continue
     gap_length = gene_start - previous_gene_stop - 1
     if (gap_length > args.gap_len_cutoff and
             gap_has_not_too_many_ns(seq_lookup, seq_name,
                                     previous_gene_stop,
-                                    gene_start, n_stretch)):
+                                    gene_start, args.gap_n_stretch_cutoff)):
         if not gap_tsv_fh:
             gap_tsv = args.contigs_fasta[0:args.contigs_fasta.rfind("_")]
             gap_tsv += "_too_long_intergenig_regions.tsv"
             gap_tsv_fh = open(gap_tsv, 'w')
-        gap_tsv_fh.write(fields[0] + "\t" + str(previous_gene_stop+1) + "\t" +
+        gap_tsv_fh.write(seq_name + "\t" + str(previous_gene_stop+1) + "\t" +
                          str(gene_start-1) + "\t" + str(gap_length) + "\n")
         big_gaps_count += 1
     previous_gene_stop = gene_stop
 
 
 total_coding_bp = 0
-for bp_tracker in coding_bp_tracker.values():
-    total_coding_bp += sum(bp_tracker)
+for gene_intervals in coding_bp_tracker.values():
+    total_coding_bp += get_union_length(gene_intervals)
 coding_density = total_coding_bp / total_bp
 if coding_density < args.lower_coding_density_cutoff:
     reason = "The coding density is only "
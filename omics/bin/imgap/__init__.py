@@ -0,0 +1 @@
+"""Shared helpers for the IMG annotation pipeline (IMGAP) scripts."""
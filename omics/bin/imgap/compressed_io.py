@@ -0,0 +1,180 @@
+"""Transparent reading and writing of compressed files. Inputs get
+recognized by their magic bytes (gzip, which includes bgzip, and zstd),
+outputs by their file name suffix (.gz, .bgz or .zst). Where the pigz or zstd
+executables are available they do the (multi-threaded) work in a separate
+process, otherwise the gzip module or the zstandard package get used."""
+
+import argparse
+import gzip
+import io
+import os
+import shutil
+import signal
+import subprocess
+import sys
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_SUFFIXES = (".gz", ".bgz")
+ZSTD_SUFFIXES = (".zst",)
+COMPRESSION_LEVEL = 6
+
+
+
+class Process_File:
+    """A file object reading from the stdout or writing to the stdin of a
+    (de)compressor process. Closing it waits for the process and raises an
+    OSError if the process failed."""
+
+    def __init__(self, command, path, mode):
+        self.command = command
+        self.path = path
+        self.reading = "r" in mode
+        if self.reading:
+            self.process = subprocess.Popen(command + [path],
+                                            stdout=subprocess.PIPE)
+            pipe = self.process.stdout
+            self.output_fh = None
+        else:
+            self.output_fh = open(path, "wb")
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                            stdout=self.output_fh)
+            pipe = self.process.stdin
+        self.file_handle = pipe if "b" in mode else io.TextIOWrapper(pipe)
+
+
+    def __getattr__(self, name):
+        return getattr(self.file_handle, name)
+
+
+    def __iter__(self):
+        return iter(self.file_handle)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def close(self):
+        if self.process is None:
+            return
+        self.file_handle.close()
+        return_code = self.process.wait()
+        self.process = None
+        if self.output_fh is not None:
+            self.output_fh.close()
+        """A reader that stops early closes the pipe, which kills the
+        decompressor with SIGPIPE; that's not an error."""
+        if self.reading and return_code == -signal.SIGPIPE:
+            return
+        if return_code:
+            raise OSError(" ".join(self.command) + " failed on " + self.path +
+                          " (exit code " + str(return_code) + ").")
+
+
+
+def get_compression(path):
+    """Returns 'gzip', 'zstd' or None, based on the first bytes of the
+    file."""
+    with open(path, "rb") as fr:
+        magic = fr.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def get_threads(threads=None):
+    if threads:
+        return threads
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def open_input(path, mode="r"):
+    """Opens a possibly compressed file for reading, as text unless 'b' is in
+    the mode. '-' is stdin (which doesn't get decompressed)."""
+    if path == "-":
+        return sys.stdin.buffer if "b" in mode else sys.stdin
+    compression = get_compression(path)
+    if compression is None:
+        return open(path, "rb" if "b" in mode else "r")
+    if compression == "gzip":
+        if shutil.which("pigz"):
+            return Process_File(["pigz", "-dc"], path, mode)
+        return gzip.open(path, "rb" if "b" in mode else "rt")
+    if shutil.which("zstd"):
+        return Process_File(["zstd", "-dcq"], path, mode)
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(path + " is zstd compressed, which needs the zstd " +
+                         "executable or the zstandard package.")
+    return zstandard.open(path, "rb" if "b" in mode else "rt")
+
+
+def open_output(path, mode="w", threads=None):
+    """Opens a file for writing, as text unless 'b' is in the mode, and
+    compresses it if its name ends with .gz/.bgz (gzip) or .zst (zstd).
+    '-' is stdout."""
+    if path == "-":
+        return sys.stdout.buffer if "b" in mode else sys.stdout
+    if path.endswith(GZIP_SUFFIXES):
+        if shutil.which("pigz"):
+            return Process_File(["pigz", "-c", "-" + str(COMPRESSION_LEVEL),
+                                 "-p", str(get_threads(threads))], path, mode)
+        return gzip.open(path, "wb" if "b" in mode else "wt",
+                         compresslevel=COMPRESSION_LEVEL)
+    if path.endswith(ZSTD_SUFFIXES):
+        if shutil.which("zstd"):
+            return Process_File(["zstd", "-cq",
+                                 "-T" + str(get_threads(threads))], path, mode)
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Writing " + path + " needs the zstd " +
+                             "executable or the zstandard package.")
+        return zstandard.open(path, "wb" if "b" in mode else "wt",
+                              cctx=zstandard.ZstdCompressor(
+                                       threads=get_threads(threads)))
+    return open(path, "wb" if "b" in mode else "w")
+
+
+def get_compression_suffix(path):
+    """Returns the compression suffix of the file name (or '')."""
+    for suffix in GZIP_SUFFIXES + ZSTD_SUFFIXES:
+        if path.endswith(suffix):
+            return suffix
+    return ""
+
+
+def strip_compression_suffix(path):
+    suffix = get_compression_suffix(path)
+    return path[:-len(suffix)] if suffix else path
+
+
+def input_file_type(path):
+    """For argparse: opens a possibly compressed input file (like
+    argparse.FileType('r'))."""
+    try:
+        return open_input(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError("can't open '" + path + "': " +
+                                         str(e))
+
+
+def output_file_type(path):
+    """For argparse: opens an output file, compressed depending on its name
+    (like argparse.FileType('w'))."""
+    try:
+        return open_output(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError("can't open '" + path + "': " +
+                                         str(e))
@@ -0,0 +1,60 @@
+"""Sorting of more items than fit into memory: the items get sorted in runs
+of a bounded size, the runs get spilled to tmp files and then k-way merged."""
+
+import heapq
+import pickle
+import tempfile
+
+
+RUN_BATCH_SIZE = 10000
+
+
+
+def write_run(items, tmp_dir=None):
+    """Writes the (already sorted) items to an anonymous tmp file in batches
+    and returns the file rewound to its start."""
+    run_file = tempfile.TemporaryFile(dir=tmp_dir)
+    for i in range(0, len(items), RUN_BATCH_SIZE):
+        pickle.dump(items[i:i+RUN_BATCH_SIZE], run_file,
+                    pickle.HIGHEST_PROTOCOL)
+    run_file.seek(0)
+    return run_file
+
+
+def read_run(run_file):
+    while True:
+        try:
+            batch = pickle.load(run_file)
+        except EOFError:
+            return
+        for item in batch:
+            yield item
+
+
+def get_sorted(items, key=None, max_items_in_memory=None, tmp_dir=None):
+    """Yields the items in sorted order. As long as there are no more than
+    max_items_in_memory items (or no limit is given) they get sorted in
+    memory. The sort is stable, also across runs."""
+    buffer = []
+    run_files = []
+    try:
+        for item in items:
+            buffer.append(item)
+            if max_items_in_memory and len(buffer) >= max_items_in_memory:
+                buffer.sort(key=key)
+                run_files.append(write_run(buffer, tmp_dir))
+                buffer = []
+        buffer.sort(key=key)
+        if not run_files:
+            for item in buffer:
+                yield item
+            return
+        if buffer:
+            run_files.append(write_run(buffer, tmp_dir))
+            buffer = []
+        for item in heapq.merge(*[read_run(run_file)
+                                  for run_file in run_files], key=key):
+            yield item
+    finally:
+        for run_file in run_files:
+            run_file.close()
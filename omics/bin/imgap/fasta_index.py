@@ -0,0 +1,174 @@
+"""faidx-style index of a FASTA file, built in one streaming pass."""
+
+import mmap
+import re
+from bisect import bisect_left
+
+from imgap.records import Record
+from imgap.compressed_io import open_input, get_compression
+
+
+N_RUN = re.compile(b"N+")
+WHITESPACE = b" \t\r\n\x0b\x0c"
+
+
+
+class Fasta_Record(Record):
+    """Location of one sequence in the FASTA file. As for a .fai file,
+    line_bases and line_width are the number of bases and bytes per sequence
+    line (0 if the lines don't all have the same length). Stretches of Ns
+    of the minimum run length or longer are kept as sorted start and end
+    coordinates (1-based, end inclusive)."""
+    __slots__ = ("name", "length", "offset", "end_offset", "line_bases",
+                 "line_width", "n_run_starts", "n_run_ends")
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.length = 0
+        self.offset = offset
+        self.end_offset = offset
+        self.line_bases = -1
+        self.line_width = -1
+        self.n_run_starts = ()
+        self.n_run_ends = ()
+
+
+    def add_n_run(self, start, end):
+        if not self.n_run_starts:
+            self.n_run_starts = []
+            self.n_run_ends = []
+        self.n_run_starts.append(start)
+        self.n_run_ends.append(end)
+
+
+
+class Fasta_Index:
+    """Sequence names (the full header line without '>' or, if requested,
+    only its first word), lengths, byte offsets and N runs of all sequences
+    in a FASTA file. The sequences themselves are not kept in memory, but can
+    get read from the memory mapped file (which needs the FASTA to be
+    uncompressed; a compressed one can only get indexed)."""
+    def __init__(self, fasta_file, min_n_run_length=100,
+                 name_is_first_word=False):
+        self.fasta_file = fasta_file
+        self.min_n_run_length = min_n_run_length
+        self.name_is_first_word = name_is_first_word
+        self.records = {}
+        self.mm = None
+        self.compressed = get_compression(fasta_file) is not None
+        self.build()
+
+
+    def build(self):
+        record = None
+        offset = 0
+        with open_input(self.fasta_file, "rb") as fr:
+            for line in fr:
+                if line.startswith(b">"):
+                    if record is not None:
+                        self.add_n_run(record, n_run_start, n_run_end)
+                        self.finish_record(record)
+                    name = line[1:].rstrip().decode()
+                    if self.name_is_first_word and name:
+                        name = name.split(None, 1)[0]
+                    record = Fasta_Record(name, offset + len(line))
+                    self.records[record.name] = record
+                    """The currently open N run (can span multiple lines)."""
+                    n_run_start = 0
+                    n_run_end = 0
+                    short_line_seen = False
+                elif record is not None:
+                    seq = line.rstrip()
+                    """Check if the line geometry allows faidx-style random
+                    access (only the last line may be shorter)."""
+                    if record.line_bases < 0:
+                        record.line_bases = len(seq)
+                        record.line_width = len(line)
+                    elif (short_line_seen or len(seq) > record.line_bases or
+                            len(line) - len(seq) !=
+                            record.line_width - record.line_bases):
+                        record.line_bases = 0
+                        record.line_width = 0
+                    if len(seq) < record.line_bases:
+                        short_line_seen = True
+                    if b"N" in seq:
+                        for match in N_RUN.finditer(seq):
+                            start = record.length + match.start() + 1
+                            end = record.length + match.end()
+                            if n_run_end and start == n_run_end + 1:
+                                n_run_end = end
+                            else:
+                                self.add_n_run(record, n_run_start, n_run_end)
+                                n_run_start = start
+                                n_run_end = end
+                    record.length += len(seq)
+                    record.end_offset = offset + len(line)
+                    if n_run_end and n_run_end < record.length:
+                        self.add_n_run(record, n_run_start, n_run_end)
+                        n_run_start = 0
+                        n_run_end = 0
+                offset += len(line)
+            if record is not None:
+                self.add_n_run(record, n_run_start, n_run_end)
+                self.finish_record(record)
+
+
+    def add_n_run(self, record, start, end):
+        if end and end - start + 1 >= self.min_n_run_length:
+            record.add_n_run(start, end)
+
+
+    def finish_record(self, record):
+        if record.line_bases < 0:
+            record.line_bases = 0
+            record.line_width = 0
+
+
+    def __contains__(self, name):
+        return name in self.records
+
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def get_length(self, name):
+        return self.records[name].length
+
+
+    def get_sequence(self, name):
+        """Reads the sequence of the given name from the memory mapped file
+        (without line breaks or other whitespace)."""
+        record = self.records[name]
+        if self.compressed:
+            raise ValueError("Can't read sequences from the compressed " +
+                             self.fasta_file + ".")
+        if self.mm is None:
+            with open(self.fasta_file, "rb") as fr:
+                self.mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm[record.offset:record.end_offset].translate(
+                   None, WHITESPACE).decode()
+
+
+    def has_n_stretch(self, name, start, end, n_stretch_length=None):
+        """Checks if the region from start to end (1-based, inclusive) of the
+        given sequence contains at least n_stretch_length consecutive Ns.
+        Only N runs of at least min_n_run_length got indexed, so
+        n_stretch_length can't be smaller than that."""
+        if n_stretch_length is None:
+            n_stretch_length = self.min_n_run_length
+        record = self.records[name]
+        start = max(start, 1)
+        end = min(end, record.length)
+        i = bisect_left(record.n_run_ends, start)
+        while i < len(record.n_run_starts) and record.n_run_starts[i] <= end:
+            overlap = (min(end, record.n_run_ends[i]) -
+                       max(start, record.n_run_starts[i]) + 1)
+            if overlap >= n_stretch_length:
+                return True
+            i += 1
+        return False
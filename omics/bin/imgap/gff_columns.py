@@ -0,0 +1,197 @@
+"""Binary, column wise copy of the fields of a GFF file that the scripts after
+the GFF merging need. gff_files_merger.py writes it next to the merged GFF,
+so the later scripts can load a few arrays instead of tokenizing the largest
+text file of the pipeline again."""
+
+import os
+import stat
+import struct
+import sys
+from array import array
+
+from imgap.compressed_io import get_compression
+
+
+MAGIC = b"IMGAPGFF"
+"""Gets increased whenever the layout of the file changes."""
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIqq")
+LENGTH = struct.Struct("<q")
+
+
+
+class Gff_Columns:
+    """One entry per GFF line (in the GFF order) in each column: the sequence
+    name, source and type (as indices into their name lists), start, end,
+    strand, the gene ID (the value of the first attribute), the shortened
+    info (empty if the gene didn't get shortened) and whether the line has a
+    Parent attribute."""
+
+    def __init__(self):
+        self.seq_names = []
+        self.sources = []
+        self.types = []
+        self.lookups = ({}, {}, {})
+        self.seq_name_indices = array("I")
+        self.source_indices = array("I")
+        self.type_indices = array("I")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.strands = bytearray()
+        self.gene_ids = []
+        self.shortened_infos = []
+        self.has_parent = bytearray()
+        """Size of the GFF file the columns belong to (-1 if unknown)."""
+        self.gff_size = -1
+
+
+    def __len__(self):
+        return len(self.starts)
+
+
+    def get_index(self, names, lookup, name):
+        index = lookup.get(name)
+        if index is None:
+            index = len(names)
+            names.append(name)
+            lookup[name] = index
+        return index
+
+
+    def add(self, seq_name, source, feature_type, start, end, strand,
+            attributes):
+        self.seq_name_indices.append(self.get_index(self.seq_names,
+                                                    self.lookups[0], seq_name))
+        self.source_indices.append(self.get_index(self.sources,
+                                                  self.lookups[1], source))
+        self.type_indices.append(self.get_index(self.types, self.lookups[2],
+                                                feature_type))
+        self.starts.append(start)
+        self.ends.append(end)
+        self.strands.append(ord(strand[:1] or "."))
+        self.gene_ids.append(attributes.split(";", 1)[0].partition("=")[2])
+        if "shortened=" in attributes:
+            self.shortened_infos.append(
+                attributes.split("shortened=", 1)[1].split(";", 1)[0].rstrip())
+        else:
+            self.shortened_infos.append("")
+        self.has_parent.append("Parent=" in attributes)
+
+
+    def add_line(self, line):
+        fields = line.rstrip("\n").split("\t")
+        self.add(fields[0], fields[1], fields[2], int(fields[3]),
+                 int(fields[4]), fields[6], fields[8])
+
+
+    def extend(self, gff_columns):
+        """Appends the columns of another Gff_Columns object (e.g. one that a
+        worker process built for a single contig)."""
+        for names, lookup, indices, other_names, other_indices in (
+                (self.seq_names, self.lookups[0], self.seq_name_indices,
+                 gff_columns.seq_names, gff_columns.seq_name_indices),
+                (self.sources, self.lookups[1], self.source_indices,
+                 gff_columns.sources, gff_columns.source_indices),
+                (self.types, self.lookups[2], self.type_indices,
+                 gff_columns.types, gff_columns.type_indices)):
+            index_map = [self.get_index(names, lookup, name)
+                         for name in other_names]
+            indices.extend(array("I", [index_map[i] for i in other_indices]))
+        self.starts.extend(gff_columns.starts)
+        self.ends.extend(gff_columns.ends)
+        self.strands.extend(gff_columns.strands)
+        self.gene_ids.extend(gff_columns.gene_ids)
+        self.shortened_infos.extend(gff_columns.shortened_infos)
+        self.has_parent.extend(gff_columns.has_parent)
+
+
+    def get_rows(self):
+        """Yields (seq_name, source, type, start, end, strand, gene_id,
+        shortened_info, has_parent) for every GFF line."""
+        return zip(map(self.seq_names.__getitem__, self.seq_name_indices),
+                   map(self.sources.__getitem__, self.source_indices),
+                   map(self.types.__getitem__, self.type_indices),
+                   self.starts, self.ends, self.strands.decode(),
+                   self.gene_ids, self.shortened_infos,
+                   map(bool, self.has_parent))
+
+
+    def save(self, columns_file, gff_size=-1):
+        """The arrays get written little endian, whatever the platform."""
+        self.gff_size = gff_size
+        tmp_file = columns_file + ".tmp"
+        with open(tmp_file, "wb") as fw:
+            fw.write(HEADER.pack(MAGIC, FORMAT_VERSION, gff_size, len(self)))
+            for names in (self.seq_names, self.sources, self.types,
+                          self.gene_ids, self.shortened_infos):
+                blob = "\n".join(names).encode()
+                fw.write(LENGTH.pack(len(names)))
+                fw.write(LENGTH.pack(len(blob)))
+                fw.write(blob)
+            for column in (self.seq_name_indices, self.source_indices,
+                           self.type_indices, self.starts, self.ends):
+                if sys.byteorder == "big":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                fw.write(column.tobytes())
+            fw.write(self.strands)
+            fw.write(self.has_parent)
+        os.replace(tmp_file, columns_file)
+
+
+    @classmethod
+    def load(cls, columns_file, gff_file=None):
+        """Raises a ValueError if the file is no (current) columns file or, if
+        the GFF file is given, if it doesn't match the size of the GFF the
+        columns were saved for. The size of compressed GFFs can't get
+        checked."""
+        gff_columns = cls()
+        with open(columns_file, "rb") as fr:
+            magic, version, gff_size, number_of_lines = HEADER.unpack(
+                fr.read(HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(columns_file + " is no GFF columns file of " +
+                                 "version " + str(FORMAT_VERSION) + ".")
+            if (gff_file is not None and gff_size >= 0 and
+                    get_compression(gff_file) is None and
+                    os.path.getsize(gff_file) != gff_size):
+                raise ValueError(columns_file + " doesn't belong to " +
+                                 gff_file + " (or the GFF changed since).")
+            gff_columns.gff_size = gff_size
+            names_lists = []
+            for i in range(5):
+                number_of_names = LENGTH.unpack(fr.read(LENGTH.size))[0]
+                blob_size = LENGTH.unpack(fr.read(LENGTH.size))[0]
+                blob = fr.read(blob_size).decode()
+                names_lists.append(blob.split("\n") if number_of_names else [])
+            (gff_columns.seq_names, gff_columns.sources, gff_columns.types,
+             gff_columns.gene_ids, gff_columns.shortened_infos) = names_lists
+            for names, lookup in zip((gff_columns.seq_names,
+                                      gff_columns.sources, gff_columns.types),
+                                     gff_columns.lookups):
+                lookup.update((name, i) for i, name in enumerate(names))
+            for column in (gff_columns.seq_name_indices,
+                           gff_columns.source_indices,
+                           gff_columns.type_indices, gff_columns.starts,
+                           gff_columns.ends):
+                column.frombytes(fr.read(number_of_lines * column.itemsize))
+                if sys.byteorder == "big":
+                    column.byteswap()
+            gff_columns.strands = bytearray(fr.read(number_of_lines))
+            gff_columns.has_parent = bytearray(fr.read(number_of_lines))
+        if len(gff_columns.has_parent) != number_of_lines:
+            raise ValueError(columns_file + " is truncated.")
+        return gff_columns
+
+
+
+def get_written_size(file_handle):
+    """Returns the size of the file behind the (flushed) file handle, or -1
+    if it isn't a regular file (e.g. a pipe)."""
+    try:
+        file_stat = os.fstat(file_handle.fileno())
+    except (AttributeError, OSError, ValueError):
+        return -1
+    if not stat.S_ISREG(file_stat.st_mode):
+        return -1
+    return file_stat.st_size
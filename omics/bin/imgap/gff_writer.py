@@ -0,0 +1,60 @@
+"""Buffered writing of GFF lines. The scripts used to print() every line,
+which costs a call and a write per line; the Gff_Writer collects the lines
+and writes them out in large chunks."""
+
+import sys
+
+
+"""Number of characters to collect before writing them out."""
+BUFFER_SIZE = 1 << 20
+
+
+
+class Gff_Writer:
+    """Writes GFF lines to the given file handle (stdout if none is given).
+    The lines only get written once the buffer is full, so flush() (or
+    close()) has to get called when done."""
+
+    def __init__(self, file_handle=None, buffer_size=BUFFER_SIZE):
+        self.file_handle = sys.stdout if file_handle is None else file_handle
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered_size = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def write_line(self, line):
+        """Expects the line without the newline."""
+        self.lines.append(line)
+        self.buffered_size += len(line) + 1
+        if self.buffered_size >= self.buffer_size:
+            self.flush()
+
+
+    def write_row(self, *fields):
+        """Expects the (9) columns as strings."""
+        self.write_line("\t".join(fields))
+
+
+    def flush(self):
+        if self.lines:
+            self.lines.append("")
+            self.file_handle.write("\n".join(self.lines))
+            self.lines.clear()
+            self.buffered_size = 0
+
+
+    def close(self):
+        """Flushes the buffer and closes the file handle (unless it's stdout
+        or stderr)."""
+        self.flush()
+        if self.file_handle not in (sys.stdout, sys.stderr):
+            self.file_handle.close()
+
@@ -0,0 +1,197 @@
+"""Readers for the tabular outputs of HMMER (--domtblout) and Infernal
+(--tblout). Lines get tokenized once into typed records: lengths and
+coordinates become ints, while scores and evalues keep the text hmmsearch or
+cmsearch printed, since they get written to the GFF outputs verbatim."""
+
+import heapq
+import re
+import sys
+from itertools import groupby
+from operator import itemgetter
+
+from imgap.records import Record
+from imgap.external_sort import get_sorted
+from imgap.compressed_io import open_input
+
+
+NUMERIC_PREFIX = re.compile(r"\s*(-?[0-9]*(?:\.[0-9]*)?)")
+
+
+
+class Domtblout_Hit(Record):
+    """One domain hit of a hmmsearch --domtblout (23 columns)."""
+    __slots__ = ("target_name", "target_accession", "target_length",
+                 "query_name", "query_accession", "query_length",
+                 "full_seq_evalue", "full_seq_bitscore", "full_seq_bias",
+                 "domain_number", "domain_count", "domain_c_evalue",
+                 "domain_i_evalue", "domain_bitscore", "domain_bias",
+                 "hmm_start", "hmm_end", "ali_start", "ali_end", "env_start",
+                 "env_end", "accuracy", "description")
+
+    def __init__(self, fields):
+        self.target_name = fields[0]
+        self.target_accession = fields[1]
+        self.target_length = int(fields[2])
+        self.query_name = fields[3]
+        self.query_accession = fields[4]
+        self.query_length = int(fields[5])
+        self.full_seq_evalue = fields[6]
+        self.full_seq_bitscore = fields[7]
+        self.full_seq_bias = fields[8]
+        self.domain_number = int(fields[9])
+        self.domain_count = int(fields[10])
+        self.domain_c_evalue = fields[11]
+        self.domain_i_evalue = fields[12]
+        self.domain_bitscore = fields[13]
+        self.domain_bias = fields[14]
+        self.hmm_start = int(fields[15])
+        self.hmm_end = int(fields[16])
+        self.ali_start = int(fields[17])
+        self.ali_end = int(fields[18])
+        self.env_start = int(fields[19])
+        self.env_end = int(fields[20])
+        self.accuracy = fields[21]
+        self.description = fields[22] if len(fields) > 22 else ""
+
+
+
+class Tblout_Hit(Record):
+    """One hit of a cmsearch --tblout (18 columns)."""
+    __slots__ = ("target_name", "target_accession", "query_name",
+                 "query_accession", "model_type", "model_start", "model_end",
+                 "seq_start", "seq_end", "strand", "trunc", "pass_number",
+                 "gc", "bias", "bitscore", "evalue", "inclusion",
+                 "description")
+
+    def __init__(self, fields):
+        self.target_name = fields[0]
+        self.target_accession = fields[1]
+        self.query_name = fields[2]
+        self.query_accession = fields[3]
+        self.model_type = fields[4]
+        self.model_start = int(fields[5])
+        self.model_end = int(fields[6])
+        self.seq_start = int(fields[7])
+        self.seq_end = int(fields[8])
+        self.strand = fields[9]
+        self.trunc = fields[10]
+        self.pass_number = int(fields[11])
+        self.gc = fields[12]
+        self.bias = fields[13]
+        self.bitscore = fields[14]
+        self.evalue = fields[15]
+        self.inclusion = fields[16]
+        self.description = fields[17] if len(fields) > 17 else ""
+
+
+
+def read_table(lines, record_class, number_of_columns):
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        """The description (last column) can contain spaces."""
+        fields = line.split(None, number_of_columns - 1)
+        if not fields:
+            continue
+        if len(fields) < number_of_columns - 1:
+            raise ValueError("Expected " + str(number_of_columns) +
+                             " columns, got " + str(len(fields)) + ": " +
+                             line.rstrip())
+        yield record_class(fields)
+
+
+def read_domtblout(lines):
+    """Yields a Domtblout_Hit for each line of a domtblout (skipping the
+    comment lines)."""
+    return read_table(lines, Domtblout_Hit, 23)
+
+
+def read_tblout(lines):
+    """Yields a Tblout_Hit for each line of a cmsearch tblout (skipping the
+    comment lines)."""
+    return read_table(lines, Tblout_Hit, 18)
+
+
+def get_numeric_sort_value(value):
+    """Mimics 'sort -n', which only looks at the leading number of a field
+    (so an evalue of 1.2e-30 sorts as 1.2) and treats anything else as 0."""
+    try:
+        return float(NUMERIC_PREFIX.match(value).group(1))
+    except ValueError:
+        return 0.0
+
+
+def get_hit_sort_key(hit):
+    return hit[0], hit[1]
+
+
+def get_sorted_keyed_hits(hits, attributes, bitscore_attribute,
+                          evalue_attribute, max_hits_in_memory=None,
+                          tmp_dir=None):
+    """Turns each hit into the list of the given attributes (the columns the
+    filters used to get from awk, target_name first) and yields them as
+    (target_name, sort_key, hit_fields) in the order
+    'sort -k1,1 -k<bitscore>nr -k<evalue>n' creates in the C locale: by
+    target name, descending bitscore, ascending evalue and the text of the
+    columns. If there are more than max_hits_in_memory hits they get sorted
+    externally (see imgap.external_sort)."""
+    def get_keyed_hits():
+        for hit in hits:
+            hit_fields = [getattr(hit, attribute) for attribute in attributes]
+            sort_key = (
+                -get_numeric_sort_value(getattr(hit, bitscore_attribute)),
+                get_numeric_sort_value(getattr(hit, evalue_attribute)),
+                " ".join([str(field) for field in hit_fields]))
+            yield hit.target_name, sort_key, hit_fields
+
+    return get_sorted(get_keyed_hits(), get_hit_sort_key, max_hits_in_memory,
+                      tmp_dir)
+
+
+def group_by_target(sorted_keyed_hits):
+    for target_name, target_hits in groupby(sorted_keyed_hits, itemgetter(0)):
+        yield target_name, [hit[2] for hit in target_hits]
+
+
+def get_sorted_hits_by_target(hits, attributes, bitscore_attribute,
+                              evalue_attribute, max_hits_in_memory=None,
+                              tmp_dir=None):
+    """Yields the target (gene or sequence) names with their hits, sorted as
+    described for get_sorted_keyed_hits(). The input doesn't need to be
+    sorted or grouped."""
+    return group_by_target(get_sorted_keyed_hits(hits, attributes,
+                                                 bitscore_attribute,
+                                                 evalue_attribute,
+                                                 max_hits_in_memory, tmp_dir))
+
+
+def get_merged_hits_by_target(hit_streams, attributes, bitscore_attribute,
+                              evalue_attribute, max_hits_in_memory=None,
+                              tmp_dir=None):
+    """Same as get_sorted_hits_by_target() for the hits of several tables,
+    e.g. the outputs of hmmsearch runs on the splits of a proteins FASTA.
+    Each table gets sorted on its own (sharing the max_hits_in_memory) and
+    the sorted tables get k-way merged, so the targets get yielded as soon as
+    all their hits are seen. A target may have hits in more than one
+    table."""
+    if len(hit_streams) == 1:
+        return get_sorted_hits_by_target(hit_streams[0], attributes,
+                                         bitscore_attribute, evalue_attribute,
+                                         max_hits_in_memory, tmp_dir)
+    if max_hits_in_memory:
+        max_hits_in_memory = max(max_hits_in_memory // len(hit_streams), 1)
+    sorted_streams = [get_sorted_keyed_hits(hits, attributes,
+                                            bitscore_attribute,
+                                            evalue_attribute,
+                                            max_hits_in_memory, tmp_dir)
+                      for hits in hit_streams]
+    return group_by_target(heapq.merge(*sorted_streams,
+                                       key=get_hit_sort_key))
+
+
+def open_tables(paths):
+    """Opens the given (possibly compressed) tables for reading (stdin if none
+    or '-' is given)."""
+    if not paths:
+        return [sys.stdin]
+    return [open_input(path) for path in paths]
@@ -0,0 +1,147 @@
+"""Interval arithmetic on 1-based, end inclusive coordinates (as in GFF)."""
+
+from bisect import bisect_left, bisect_right
+
+
+def get_union_length(intervals):
+    """Returns the number of positions covered by at least one of the given
+    (start, end) intervals. Sorts the intervals and sweeps over them once,
+    instead of marking every covered position."""
+    covered_length = 0
+    covered_end = 0
+    for start, end in sorted(intervals):
+        if end < start:
+            continue
+        if start > covered_end:
+            covered_length += end - start + 1
+            covered_end = end
+        elif end > covered_end:
+            covered_length += end - covered_end
+            covered_end = end
+    return covered_length
+
+
+def get_coverage(intervals):
+    """Returns the positions covered by the given (start, end) intervals as
+    sorted, disjoint (start, end, depth) segments, the depth being the number
+    of intervals that cover the segment."""
+    events = []
+    for start, end in intervals:
+        if end < start:
+            continue
+        events.append((start, 1))
+        events.append((end + 1, -1))
+    events.sort()
+    segments = []
+    depth = 0
+    previous_position = 0
+    for position, change in events:
+        if depth > 0 and position > previous_position:
+            segments.append((previous_position, position - 1, depth))
+        depth += change
+        previous_position = position
+    return segments
+
+
+def get_coverage_overlap_length(coverage_a, coverage_b):
+    """Returns the sum of the overlap lengths of all pairs of an interval of
+    a and an interval of b, given their coverages (see get_coverage()).
+    Merges the two segment lists once instead of comparing all pairs."""
+    overlap_length = 0
+    i = 0
+    j = 0
+    while i < len(coverage_a) and j < len(coverage_b):
+        start_a, end_a, depth_a = coverage_a[i]
+        start_b, end_b, depth_b = coverage_b[j]
+        overlap_start = max(start_a, start_b)
+        overlap_end = min(end_a, end_b)
+        if overlap_start <= overlap_end:
+            overlap_length += ((overlap_end - overlap_start + 1) * depth_a *
+                               depth_b)
+        if end_a < end_b:
+            i += 1
+        else:
+            j += 1
+    return overlap_length
+
+
+
+class Disjoint_Intervals:
+    """A set of non-overlapping intervals, kept sorted by start (and thereby
+    also by end), so an overlap check only needs to look at the interval with
+    the largest start that isn't past the end of the checked interval."""
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+
+    def overlaps(self, start, end):
+        i = bisect_right(self.starts, end)
+        return i > 0 and self.ends[i-1] >= start
+
+
+    def add(self, start, end):
+        """Expects an interval that doesn't overlap any of the stored ones
+        (see overlaps())."""
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+
+class Interval_Index:
+    """A set of intervals (which may overlap or contain each other), kept
+    sorted by start. Remembers the length of the longest interval, so an
+    interval overlapping a query has to start at most that many positions
+    before the query start, which bounds the bisected range to check."""
+    __slots__ = ("starts", "ends", "max_length")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.max_length = 0
+
+
+    def __len__(self):
+        return len(self.starts)
+
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.max_length = max(self.max_length, end - start + 1)
+
+
+    def get_overlapping(self, start, end):
+        """Yields the stored (start, end) intervals that overlap the given
+        one."""
+        for i in range(bisect_left(self.starts, start - self.max_length + 1),
+                       bisect_right(self.starts, end)):
+            if self.ends[i] >= start:
+                yield self.starts[i], self.ends[i]
+
+
+
+def remove_group_overlaps(items, get_group, get_coordinates):
+    """Goes over the items in the given order (e.g. best scoring first) and
+    keeps an item unless it overlaps an already kept item of the same group.
+    Items without a group (None) are always kept. The kept items of each
+    group are disjoint, so each item only gets checked against the kept items
+    of its group around its own coordinates instead of against all items."""
+    kept_intervals = {}
+    kept_items = []
+    for item in items:
+        group = get_group(item)
+        if group is not None:
+            start, end = get_coordinates(item)
+            intervals = kept_intervals.get(group)
+            if intervals is None:
+                intervals = kept_intervals[group] = Disjoint_Intervals()
+            elif intervals.overlaps(start, end):
+                continue
+            intervals.add(start, end)
+        kept_items.append(item)
+    return kept_items
@@ -0,0 +1,100 @@
+"""Summary statistics over lengths, computed from length histograms (dicts of
+length -> number of features of that length). Feature and sequence lengths are
+integers with comparatively few distinct values, so the histograms are much
+smaller than the lists of all lengths, get filled by a dict update per
+feature (histogram[length] = histogram.get(length, 0) + 1 being the fastest
+one) and can simply get added up. The results are exactly the ones of the
+statistics module on the full lists (mean, median and stdev), including
+their int or float type."""
+
+import math
+import sys
+from collections import Counter
+from statistics import StatisticsError
+
+
+"""Bits of precision for the correctly rounded square root (as in the
+statistics module)."""
+SQRT_BIT_WIDTH = 2 * sys.float_info.mant_dig + 3
+
+
+def get_length_histogram(lengths):
+    """Counts the given lengths (in C, via Counter)."""
+    return Counter(lengths)
+
+
+def get_integer_sqrt_of_fraction(numerator, denominator):
+    """Square root of numerator / denominator, rounded to odd."""
+    root = math.isqrt(numerator // denominator)
+    return root | (root * root * denominator != numerator)
+
+
+def get_sqrt_of_fraction(numerator, denominator):
+    """Square root of numerator / denominator as a correctly rounded float,
+    like statistics.stdev() takes it of the exact variance (Python 3.11+;
+    before, it took math.sqrt() of the variance rounded to a float)."""
+    if sys.version_info < (3, 11):
+        return math.sqrt(numerator / denominator)
+    q = (numerator.bit_length() - denominator.bit_length() -
+         SQRT_BIT_WIDTH) // 2
+    if q >= 0:
+        return float(get_integer_sqrt_of_fraction(numerator,
+                                                  denominator << 2 * q) << q)
+    return (get_integer_sqrt_of_fraction(numerator << -2 * q, denominator) /
+            (1 << -q))
+
+
+def get_median(sorted_lengths, counts, number_of_lengths):
+    """Walks the sorted distinct lengths up to the middle one(s)."""
+    middle = number_of_lengths // 2
+    seen = 0
+    lower = None
+    for length, count in zip(sorted_lengths, counts):
+        seen += count
+        if number_of_lengths % 2:
+            if seen > middle:
+                return length
+        else:
+            if lower is None and seen >= middle:
+                lower = length
+            if seen > middle:
+                return (lower + length) / 2
+
+
+def get_length_stats(length_histogram):
+    """Returns the number of lengths, their sum, median, mean, minimum,
+    maximum and sample standard deviation (the last three rounded to 3
+    decimals, the standard deviation of a single length being 0)."""
+    sorted_lengths = sorted(length_histogram)
+    counts = [length_histogram[length] for length in sorted_lengths]
+    number_of_lengths = sum(counts)
+    if not number_of_lengths:
+        raise StatisticsError("no median for empty data")
+    sum_of_lengths = sum(map(int.__mul__, sorted_lengths, counts))
+    len_stats = {}
+    len_stats["Number of seqs"] = number_of_lengths
+    len_stats["Number of bps"] = sum_of_lengths
+    len_stats["Median length"] = round(get_median(sorted_lengths, counts,
+                                                  number_of_lengths), 3)
+    if sum_of_lengths % number_of_lengths:
+        mean = sum_of_lengths / number_of_lengths
+    else:
+        mean = sum_of_lengths // number_of_lengths
+    len_stats["Average length"] = round(mean, 3)
+    len_stats["Length shortest seq"] = sorted_lengths[0]
+    len_stats["Length longest seq"] = sorted_lengths[-1]
+    if number_of_lengths == 1:
+        len_stats["Standard deviation"] = 0
+    else:
+        """The exact variance as a fraction: the sum of the squared
+        deviations is (n * sum(x^2) - sum(x)^2) / n."""
+        sum_of_squares = sum(length * length * count for length, count
+                             in zip(sorted_lengths, counts))
+        numerator = (number_of_lengths * sum_of_squares -
+                     sum_of_lengths * sum_of_lengths)
+        denominator = number_of_lengths * (number_of_lengths - 1)
+        divisor = math.gcd(numerator, denominator)
+        len_stats["Standard deviation"] = round(
+            get_sqrt_of_fraction(numerator // divisor,
+                                 denominator // divisor), 3)
+    return len_stats
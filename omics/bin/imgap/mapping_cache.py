@@ -0,0 +1,106 @@
+"""Compiled caches of two column (id, value) TSV mappings. The TSVs get
+parsed once into an SQLite file, keyed by a checksum over their names, sizes
+and modification times, so later runs on the same (unchanged) mapping files
+only open the cache and look up the ids they actually need."""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+
+from imgap.compressed_io import open_input
+
+
+"""Gets increased whenever the layout of the cache changes."""
+CACHE_VERSION = 1
+
+
+
+class Cached_Mapping:
+    """Read-only, dict like access to one table of a cache. Looked up ids get
+    remembered, so each id gets queried only once."""
+
+    def __init__(self, connection, table):
+        self.connection = connection
+        self.query = "SELECT value FROM " + table + " WHERE id = ?"
+        self.looked_up = {}
+
+
+    def get(self, fa_id, default=None):
+        if fa_id not in self.looked_up:
+            row = self.connection.execute(self.query, (fa_id,)).fetchone()
+            self.looked_up[fa_id] = row[0] if row else None
+        value = self.looked_up[fa_id]
+        return default if value is None else value
+
+
+    def __contains__(self, fa_id):
+        return self.get(fa_id) is not None
+
+
+    def __getitem__(self, fa_id):
+        value = self.get(fa_id)
+        if value is None:
+            raise KeyError(fa_id)
+        return value
+
+
+
+def parse_mapping_file(tsv_file):
+    """Yields the (id, value) pairs of a mapping TSV."""
+    with open_input(tsv_file) as fr:
+        for line in fr:
+            line = line.rstrip()
+            if line:
+                fa_id, value = line.split("\t")
+                yield fa_id, value
+
+
+def get_checksum(table_files):
+    checksum = hashlib.sha1(("version " + str(CACHE_VERSION) +
+                             "\n").encode())
+    for table, tsv_file in table_files:
+        stat = os.stat(tsv_file)
+        checksum.update((table + "\t" + os.path.abspath(tsv_file) + "\t" +
+                         str(stat.st_size) + "\t" +
+                         str(stat.st_mtime_ns) + "\n").encode())
+    return checksum.hexdigest()
+
+
+def build_cache(cache_file, tables, table_files):
+    """Writes the cache to a tmp file next to cache_file and moves it in
+    place, so concurrent runs never see a partially written cache. Later
+    files override the values of earlier ones, like updating a dict would."""
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file),
+                                    prefix=os.path.basename(cache_file) + ".",
+                                    suffix=".tmp")
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_file)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        for table in tables:
+            connection.execute("CREATE TABLE " + table + " (id TEXT PRIMARY " +
+                               "KEY, value TEXT NOT NULL) WITHOUT ROWID")
+        for table, tsv_file in table_files:
+            connection.executemany("INSERT OR REPLACE INTO " + table +
+                                   " VALUES (?, ?)",
+                                   parse_mapping_file(tsv_file))
+        connection.commit()
+        connection.close()
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def open_cache(cache_dir, name, tables, table_files):
+    """Returns a Cached_Mapping for each of the given tables, filled from the
+    ordered (table, tsv_file) pairs. The cache gets built in cache_dir first
+    if there is none for the current state of the files."""
+    cache_file = os.path.join(cache_dir, name + "." +
+                              get_checksum(table_files) + ".sqlite")
+    if not os.path.exists(cache_file):
+        build_cache(cache_file, tables, table_files)
+    connection = sqlite3.connect(cache_file)
+    return {table: Cached_Mapping(connection, table) for table in tables}
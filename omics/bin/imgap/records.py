@@ -0,0 +1,43 @@
+"""Compact record types for the hits and genes the filters keep in memory."""
+
+
+class Unset:
+    """Marker for attributes that get computed on demand. Unlike None it can
+    be told apart from a computed value of None."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "UNSET"
+
+
+    def __bool__(self):
+        return False
+
+
+
+UNSET = Unset()
+
+
+
+class Record:
+    """Base class for records with a fixed set of attributes. Subclasses list
+    their attributes in __slots__, so no per instance __dict__ gets created,
+    and have to assign all of them in __init__. Attributes that used to be
+    created lazily start out as UNSET (or another explicit default)."""
+    __slots__ = ()
+
+    @classmethod
+    def get_slots(cls):
+        slots = []
+        for klass in reversed(cls.__mro__):
+            for slot in getattr(klass, "__slots__", ()):
+                if slot not in slots:
+                    slots.append(slot)
+        return slots
+
+
+    def __repr__(self):
+        return (type(self).__name__ + "(" +
+                ", ".join(slot + "=" + repr(getattr(self, slot, UNSET))
+                          for slot in self.get_slots()) +
+                ")")
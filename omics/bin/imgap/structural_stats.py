@@ -0,0 +1,230 @@
+"""The structural annotation statistics (the tables of the
+_structural_annotation_stats.tsv) as partial aggregates that can get saved
+and merged: the stats of the splits of a project add up to the ones of the
+whole project, without reading the sequences or GFFs again. All lengths are
+kept as exact length histograms (see length_stats.py), so the medians of the
+merged stats are exact as well."""
+
+import json
+import os
+
+from imgap.length_stats import get_length_stats
+
+
+FORMAT_NAME = "imgap_structural_annotation_stats"
+"""Gets increased whenever the layout of the file changes."""
+FORMAT_VERSION = 1
+
+
+
+class Structural_Stats:
+    """The sequence length histograms (of the sequences with and without
+    genes), the coding bps and predicted features in total and, per tool and
+    feature type (in the order they were first seen), the feature length
+    histogram and the number of sequences the features were found on. The
+    long intergenic regions (gaps) are kept as (seq name, start, end, length)
+    lists. Merged stats assume that no sequence is part of more than one of
+    them (as with the splits of a project)."""
+
+    def __init__(self):
+        self.seq_lengths_with_genes = {}
+        self.seq_lengths_without_genes = {}
+        self.total_coding_bps = 0
+        self.total_predicted_genes = 0
+        self.tool_data = {}
+        self.gaps_data = []
+
+
+    def add_sequence(self, length, coding_bps=None):
+        """coding_bps is None for sequences without any features."""
+        if coding_bps is None:
+            histogram = self.seq_lengths_without_genes
+        else:
+            histogram = self.seq_lengths_with_genes
+            self.total_coding_bps += coding_bps
+        histogram[length] = histogram.get(length, 0) + 1
+
+
+    def get_feature_data(self, tool, feature_type):
+        if tool not in self.tool_data:
+            self.tool_data[tool] = {}
+        if feature_type not in self.tool_data[tool]:
+            self.tool_data[tool][feature_type] = {"feature_lengths": {},
+                                                  "number_of_seqs": 0}
+        return self.tool_data[tool][feature_type]
+
+
+    def add_features(self, tool, feature_type, feature_lengths,
+                     number_of_seqs):
+        """Adds a length histogram of the features of the given tool and
+        type, found on number_of_seqs sequences."""
+        feature_data = self.get_feature_data(tool, feature_type)
+        add_histogram(feature_data["feature_lengths"], feature_lengths)
+        feature_data["number_of_seqs"] += number_of_seqs
+        self.total_predicted_genes += sum(feature_lengths.values())
+
+
+    def add_gap(self, seq_name, gap_start, gap_end, gap_length):
+        self.gaps_data.append([seq_name, gap_start, gap_end, gap_length])
+
+
+    def merge(self, structural_stats):
+        """Adds the stats of another (e.g. the next split's) Structural_Stats
+        object."""
+        add_histogram(self.seq_lengths_with_genes,
+                      structural_stats.seq_lengths_with_genes)
+        add_histogram(self.seq_lengths_without_genes,
+                      structural_stats.seq_lengths_without_genes)
+        self.total_coding_bps += structural_stats.total_coding_bps
+        for tool in structural_stats.tool_data:
+            for feature_type, feature_data in (
+                    structural_stats.tool_data[tool].items()):
+                self.add_features(tool, feature_type,
+                                  feature_data["feature_lengths"],
+                                  feature_data["number_of_seqs"])
+        self.gaps_data.extend(structural_stats.gaps_data)
+
+
+    def save(self, stats_file):
+        """JSON, with the histograms as [length, count] pairs (JSON keys
+        would have to be strings)."""
+        tool_data = [[tool, feature_type,
+                      sorted(feature_data["feature_lengths"].items()),
+                      feature_data["number_of_seqs"]]
+                     for tool in self.tool_data
+                     for feature_type, feature_data
+                     in self.tool_data[tool].items()]
+        partials = {"format": FORMAT_NAME,
+                    "version": FORMAT_VERSION,
+                    "seq_lengths_with_genes": sorted(
+                        self.seq_lengths_with_genes.items()),
+                    "seq_lengths_without_genes": sorted(
+                        self.seq_lengths_without_genes.items()),
+                    "total_coding_bps": self.total_coding_bps,
+                    "total_predicted_genes": self.total_predicted_genes,
+                    "tool_data": tool_data,
+                    "gaps_data": self.gaps_data}
+        tmp_file = stats_file + ".tmp"
+        with open(tmp_file, "w") as fw:
+            json.dump(partials, fw, separators=(",", ":"))
+            fw.write("\n")
+        os.replace(tmp_file, stats_file)
+
+
+    @classmethod
+    def load(cls, stats_file):
+        """Raises a ValueError if the file is no (current) stats file."""
+        with open(stats_file) as fr:
+            try:
+                partials = json.load(fr)
+            except ValueError:
+                partials = None
+        if (not isinstance(partials, dict) or
+                partials.get("format") != FORMAT_NAME or
+                partials.get("version") != FORMAT_VERSION):
+            raise ValueError(stats_file + " is no structural annotation " +
+                             "stats file of version " + str(FORMAT_VERSION) +
+                             ".")
+        structural_stats = cls()
+        structural_stats.seq_lengths_with_genes = dict(
+            map(tuple, partials["seq_lengths_with_genes"]))
+        structural_stats.seq_lengths_without_genes = dict(
+            map(tuple, partials["seq_lengths_without_genes"]))
+        structural_stats.total_coding_bps = partials["total_coding_bps"]
+        for tool, feature_type, feature_lengths, number_of_seqs in (
+                partials["tool_data"]):
+            structural_stats.add_features(tool, feature_type,
+                                          dict(map(tuple, feature_lengths)),
+                                          number_of_seqs)
+        if (structural_stats.total_predicted_genes !=
+                partials["total_predicted_genes"]):
+            raise ValueError(stats_file + " is inconsistent.")
+        structural_stats.gaps_data = partials["gaps_data"]
+        return structural_stats
+
+
+    def write_tables(self, stats_out_file):
+        """Writes the tables of the _structural_annotation_stats.tsv."""
+        with open(stats_out_file, "w") as fw:
+            all_seq_lengths = dict(self.seq_lengths_with_genes)
+            add_histogram(all_seq_lengths, self.seq_lengths_without_genes)
+            stats_dict = get_length_stats(all_seq_lengths)
+            stats_dict["Data type"] = "'final_fasta'"
+            """ Remember how many bps got processed in total. """
+            processed_bps = stats_dict["Number of bps"]
+            number_of_seqs = stats_dict["Number of seqs"]
+            table_data = [stats_dict]
+            stats_dict = get_length_stats(self.seq_lengths_with_genes)
+            stats_dict["Data type"] = "'sequences_with_genes'"
+            table_data.append(stats_dict)
+            if self.seq_lengths_without_genes:
+                stats_dict = get_length_stats(self.seq_lengths_without_genes)
+                stats_dict["Data type"] = "'sequences_without_genes'"
+                table_data.append(stats_dict)
+            write_table(fw, "Processed Sequences Statistics",
+                        ["Data type", "Number of seqs", "Number of bps",
+                         "Length shortest seq", "Length longest seq",
+                         "Average length", "Median length",
+                         "Standard deviation"], table_data)
+
+            table_data = []
+            for tool in self.tool_data:
+                for feature_type, feature_data in self.tool_data[tool].items():
+                    stats_dict = get_length_stats(
+                        feature_data["feature_lengths"])
+                    stats_dict["Number of predicted features"] = (
+                        stats_dict["Number of seqs"])
+                    stats_dict["Number of seqs"] = (
+                        feature_data["number_of_seqs"])
+                    stats_dict["Prediction method"] = "'" + tool + "'"
+                    stats_dict["Feature type"] = "'" + feature_type + "'"
+                    table_data.append(stats_dict)
+            write_table(fw, "Predicted Genes Statistics",
+                        ["Feature type", "Prediction method",
+                         "Number of predicted features", "Number of seqs",
+                         "Number of bps", "Length shortest seq",
+                         "Length longest seq", "Average length",
+                         "Median length", "Standard deviation"], table_data)
+
+            coding_density = round((self.total_coding_bps / processed_bps *
+                                    100), 2)
+            stats_dict = {}
+            stats_dict["Coding density"] = str(coding_density) + "%"
+            genes_per_million_bp = round((self.total_predicted_genes *
+                                          1000000 / processed_bps), 2)
+            stats_dict["Genes per 1M bp"] = str(genes_per_million_bp)
+            seqs_per_million_bp = round((number_of_seqs * 1000000 /
+                                         processed_bps), 2)
+            stats_dict["Seqs per 1M bp"] = str(seqs_per_million_bp)
+            write_table(fw, "General Quality Info",
+                        ["Coding density", "Genes per 1M bp",
+                         "Seqs per 1M bp"], [stats_dict])
+
+            if self.gaps_data:
+                column_names = ["Seq name", "Gap start", "Gap end",
+                                "Gap length"]
+                write_table(fw, "Long Intergenic Regions", column_names,
+                            [dict(zip(column_names, map(str, gap)))
+                             for gap in self.gaps_data])
+
+
+
+def add_histogram(histogram, other_histogram):
+    for length, count in other_histogram.items():
+        histogram[length] = histogram.get(length, 0) + count
+
+
+def write_table(file_writer, title, column_names, data):
+    """Writes out the given data (a dict per row) in a formatted table."""
+    frame_width = sum([len(column_name) + 3 for column_name in column_names])
+    file_writer.write(title + "\n")
+    """ Top frame line and header row (with its separator line). """
+    file_writer.write("=" * frame_width + "\n")
+    file_writer.write("\t".join(column_names) + "\n")
+    file_writer.write("-" * frame_width + "\n")
+    for data_dict in data:
+        file_writer.write("\t".join([str(data_dict[column_name])
+                                     for column_name in column_names]) + "\n")
+    """ Bottom frame line. """
+    file_writer.write("=" * frame_width + "\n")
+    file_writer.write("\n\n")
@@ -60,15 +60,12 @@ tool_and_version=${tool_and_version:2}
 
 echo "$(date +%F_%T) - Executing clan filtering and GFF transformation now..."
 rfam_gff="${input_fasta%_*}_rfam.gff"
-grep -v '^#' $rfam_tbl_out |\
-awk '$17 == "!" {print $1,$3,$4,$6,$7,$8,$9,$10,$11,$15,$16}' |\
-sort -k1,1 -k10,10nr -k11,11n |\
-$(dirname $0)/rfam_clan_filter.py "$tool_and_version" \
-	$rfam_clan_info_tsv $rfam_img_ncbi_feature_tsv > $rfam_gff
+$(dirname $0)/rfam_clan_filter.py -t "$tool_and_version" \
+	$rfam_clan_info_tsv $rfam_img_ncbi_feature_tsv $rfam_tbl_out > $rfam_gff
 exit_code=$?
 if [[ $exit_code -ne 0 ]]
 then
-	echo "The pipe command failed! Aborting!" >&2
+	echo "The clan filtering failed! Aborting!" >&2
 	exit $exit_code
 fi
 
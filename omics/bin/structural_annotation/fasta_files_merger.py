@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import mmap
+import multiprocessing
 import os
 import sys
 
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.compressed_io import (open_input, open_output, get_compression,
+                                 get_compression_suffix,
+                                 strip_compression_suffix)
+from imgap.gff_columns import Gff_Columns
+
 parser = argparse.ArgumentParser(description="""This script filters out
                                  nucleotide or protein sequences from one or
                                  more fasta files based on the presence of
@@ -11,33 +20,63 @@ parser = argparse.ArgumentParser(description="""This script filters out
 
                                  If the gene's ID is present in the GFF file
                                  the gene ID and its actual sequence will get
-                                 printed out to stdout.""")
+                                 printed out to stdout.
+
+                                 The proteins need the start types found in
+                                 the genes, so the genes (fna) have to get
+                                 processed first. If the protein fasta files
+                                 and an output file for them are given
+                                 together with the gene fasta files (-p and
+                                 -o), both get written at the same time.""")
 parser.add_argument("gff", metavar="gff_file",
                     help="file path to the gff file")
 parser.add_argument("fasta_files", metavar="fasta_file", nargs="+",
                     help="file path(s) to the gene/protein fasta file(s)")
+parser.add_argument("-p", "--protein_fasta_files", metavar="protein_fasta_file",
+                    nargs="+",
+                    help="""file path(s) to the protein fasta file(s) to
+                    write along with the genes""")
+parser.add_argument("-o", "--proteins_output",
+                    help="""file path to write the proteins of the -p fasta
+                    files to""")
+parser.add_argument("-c", "--gff_columns",
+                    help="""file path to the binary columns of the gff file
+                    (written by gff_files_merger.py), to load instead of
+                    parsing the gff file (only for the genes; a separate run
+                    for the proteins needs the start types from the gff)""")
 args = parser.parse_args()
 
+if bool(args.protein_fasta_files) != bool(args.proteins_output):
+    parser.error("-p/--protein_fasta_files and -o/--proteins_output have to " +
+                 "get used together.")
+
+
+"""Number of bytes to collect before writing them out."""
+BUFFER_SIZE = 1 << 24
+"""Whitespace, other than the newlines, that has to get stripped from the end
+of the sequence lines; comment lines get skipped as well."""
+SLOW_PATH_MARKERS = (b"\r", b" ", b"\t", b"\x0b", b"\x0c", b"\n#")
+
 
 """Figure out if we are dealing with nucleotide or protein sequences."""
-suffix = args.fasta_files[0][-3:]
+suffix = strip_compression_suffix(args.fasta_files[0])[-3:]
 allowed_start_codons = frozenset(["ATG", "GTG", "TTG"])
+if args.protein_fasta_files and suffix != "fna":
+    parser.error("With -p/--protein_fasta_files the other fasta files have " +
+                 "to be the gene (fna) ones.")
 
-"""Parse the CDS gene IDs out of the given gff file."""
+"""Parse the CDS gene IDs out of the given gff file (or its columns)."""
 gene_to_start_type = {}
 shortened_genes = {}
-fr = open(args.gff, "r")
-for line in fr:
-    if not line or line[0] == "#" or line == "\n":
-        continue
-    start_type = ""
-    fields = line.split("\t")
-    if fields[2] != "CDS":
-        continue
-    gene_id = fields[-1].split(";", 1)[0].split("=", 1)[1]
-    if "shortened" in fields[-1]:
+"""For writing the proteins along with the genes: the original gene IDs of
+the CDSs with their ID in the gff and any start type already in the gff."""
+gff_gene_ids = {}
+gff_start_types = {}
+
+
+def add_cds(gene_id, shortened_info, start_type):
+    if shortened_info:
         gene_id_parts = gene_id.rsplit("_", 2)
-        shortened_info = fields[-1].split("shortened=", 1)[1].split(";", 1)[0]
         pos, coord = shortened_info.split()[1:]
         if pos == "start":
             gene_id_parts[1] = coord
@@ -48,14 +87,51 @@ for line in fr:
 #        print("Found shortened info '" + shortened_info + "' for gene " +
 #              gene_id + " (original: " + original_gene_id + ")",
 #              file = sys.stderr)
+        gff_gene_ids[original_gene_id] = gene_id
         gene_id = original_gene_id
-    if suffix == "faa":
-        if "start_type" in fields[-1]:
+    if start_type is not None:
+        gff_start_types[gene_id] = start_type
+    """The genes run finds the start types itself."""
+    gene_to_start_type[gene_id] = (start_type or "") if suffix == "faa" else ""
+
+
+gff_columns = None
+if args.gff_columns and suffix == "fna":
+    try:
+        gff_columns = Gff_Columns.load(args.gff_columns, args.gff)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    for (seq_name, source, feature_type, start, end, strand, gene_id,
+         shortened_info, has_parent) in gff_columns.get_rows():
+        if feature_type == "CDS":
+            add_cds(gene_id, shortened_info, None)
+else:
+    fr = open_input(args.gff)
+    for line in fr:
+        if not line or line[0] == "#" or line == "\n":
+            continue
+        fields = line.split("\t")
+        if fields[2] != "CDS":
+            continue
+        gene_id = fields[-1].split(";", 1)[0].split("=", 1)[1]
+        shortened_info = ""
+        if "shortened" in fields[-1]:
+            shortened_info = fields[-1].split("shortened=", 1)[1].split(";", 1)[0]
+            shortened_info = shortened_info.rstrip()
+        start_type = None
+        if ((suffix == "faa" or args.protein_fasta_files)
+                and "start_type" in fields[-1]):
             start_type = fields[-1].split("start_type=")[1].rstrip().split(";")[0]
-    gene_to_start_type[gene_id] = start_type
+        add_cds(gene_id, shortened_info, start_type)
+    fr.close()
 
 
-def process_and_print_gene(fields, gene_id, seq):
+def process_gene(fields, gene_id, seq, suffix, gene_to_start_type):
+    """Returns the header line and the (possibly shortened) sequence of the
+    gene. For genes (fna) it also stores the start type found in the
+    sequence."""
+    fields = list(fields)
 #    print("papg got gene: " +  gene_id, file=sys.stderr)
 #    print("seq:\n" + "\n".join([seq[0+i:i+70]
 #                                for i in range(0, len(seq), 70)]),
@@ -109,49 +185,153 @@ def process_and_print_gene(fields, gene_id, seq):
 #        print("STORING: " + gene_id + " - " + start_type + "\n\n",
 #              file = sys.stderr)
     fields.append("start_type=" + gene_to_start_type[gene_id])
-    print(" # ".join(fields))
-    print("\n".join(seq[0+i:i+70] for i in range(0, len(seq), 70)))
+    return " # ".join(fields), seq
 
 
+def read_fasta_file(fasta_file):
+    """Returns the file memory mapped (or, if it is compressed, its
+    decompressed content) to slice the selected records out of."""
+    if get_compression(fasta_file) is not None:
+        with open_input(fasta_file, "rb") as fr:
+            return fr.read()
+    with open(fasta_file, "rb") as fr:
+        if os.fstat(fr.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
 
-"""Now loop over the gene/protein fasta files."""
-already_processed = set()
-for fasta_file in args.fasta_files:
-#    print("\n\nPROCESSING: " + fasta_file + "\n", file=sys.stderr)
-    print_gene = False
-    fields = []
-    gene_id = ""
-    seq = ""
-    fr = open(fasta_file, "r")
-    for line in fr:
-        if not line or line[0] == "#" or line == "\n":
-            continue
-        if line[0] == ">":
-            if print_gene:
-                process_and_print_gene(fields, gene_id, seq)
-            print_gene = False
-            fields = line.rstrip().split(" # ")
-            gene_id = fields[0][1:]
-            if (gene_id in gene_to_start_type
-                    and gene_id not in already_processed):
-                print_gene = True
-                seq = ""
-                already_processed.add(gene_id)
-                if gene_id in shortened_genes:
-                    already_processed.add(shortened_genes[gene_id].split("\t")[0])
+
+def find_header_line(data, start):
+    """Returns the start of the next header line at or after start (which has
+    to be the start of a line) or -1."""
+    if data[start:start + 1] == b">":
+        return start
+    index = data.find(b"\n>", start)
+    return index + 1 if index != -1 else -1
+
+
+def index_fasta_file(data, gene_to_start_type, already_processed):
+    """One pass over the header lines, which returns the header fields, the
+    gene ID and the byte offsets of the sequence lines of all genes in the
+    gff (that didn't show up in an earlier fasta file yet)."""
+    records = []
+    header_start = find_header_line(data, 0)
+    while header_start != -1:
+        header_end = data.find(b"\n", header_start)
+        if header_end == -1:
+            header_end = len(data)
+        next_header_start = find_header_line(data, header_end)
+        fields = data[header_start:header_end].decode().rstrip().split(" # ")
+        gene_id = fields[0][1:]
+        if (gene_id in gene_to_start_type
+                and gene_id not in already_processed):
+            already_processed.add(gene_id)
+            if gene_id in shortened_genes:
+                already_processed.add(shortened_genes[gene_id].split("\t")[0])
+            records.append((fields, gene_id, header_end + 1,
+                            next_header_start if next_header_start != -1
+                            else len(data)))
+        header_start = next_header_start
+    return records
+
+
+def index_fasta_files(fasta_files, gene_to_start_type):
+    """Earlier fasta files take precedence over later ones."""
+    already_processed = set()
+    indexed_files = []
+    for fasta_file in fasta_files:
+        data = read_fasta_file(fasta_file)
+        indexed_files.append((data, index_fasta_file(data, gene_to_start_type,
+                                                     already_processed)))
+    return indexed_files
+
+
+def get_sequence(data, start, end):
+    """Joins the sequence lines without their trailing whitespace. Only needs
+    to look at the lines one by one if there is whitespace other than the
+    newlines or a comment line."""
+    sequence_lines = data[start:end]
+    if (sequence_lines.startswith(b"#") or
+            any(marker in sequence_lines for marker in SLOW_PATH_MARKERS)):
+        return b"".join([line.rstrip()
+                         for line in sequence_lines.split(b"\n")
+                         if not line.startswith(b"#")]).decode()
+    return sequence_lines.replace(b"\n", b"").decode()
+
+
+def get_gene_start_types(indexed_files):
+    """Processes the genes only for their start types."""
+    for data, records in indexed_files:
+        for fields, gene_id, start, end in records:
+            process_gene(fields, gene_id, get_sequence(data, start, end),
+                         "fna", gene_to_start_type)
+
+
+def write_genes(indexed_files, suffix, gene_to_start_type, output_fh):
+    """Writes the genes wrapped at 70 characters, collecting the lines to
+    write them out in large blocks."""
+    lines = []
+    buffered_size = 0
+    for data, records in indexed_files:
+        for fields, gene_id, start, end in records:
+            header, seq = process_gene(fields, gene_id,
+                                       get_sequence(data, start, end), suffix,
+                                       gene_to_start_type)
+            lines.append(header)
+            lines.extend([seq[0+i:i+70] for i in range(0, len(seq), 70)])
+            if not seq:
+                lines.append("")
+            buffered_size += len(header) + len(seq)
+            if buffered_size >= BUFFER_SIZE:
+                lines.append("")
+                output_fh.write("\n".join(lines).encode())
+                lines = []
+                buffered_size = 0
+    if lines:
+        lines.append("")
+        output_fh.write("\n".join(lines).encode())
+    output_fh.flush()
+
+
+def write_proteins(protein_start_types):
+    """Runs in a forked process, while the main process writes the genes."""
+    indexed_files = index_fasta_files(args.protein_fasta_files,
+                                      protein_start_types)
+    with open_output(args.proteins_output, "wb") as fw:
+        write_genes(indexed_files, "faa", protein_start_types, fw)
+
+
+"""Now index the gene/protein fasta files and write out their records."""
+indexed_files = index_fasta_files(args.fasta_files, gene_to_start_type)
+protein_process = None
+if args.protein_fasta_files:
+    """The start types of the proteins are the ones found in the genes (unless
+    they were in the gff already), just like in a separate run on the gff the
+    genes run added them to."""
+    get_gene_start_types(indexed_files)
+    protein_start_types = {}
+    for gene_id in gene_to_start_type:
+        if gene_id in gff_start_types:
+            protein_start_types[gene_id] = gff_start_types[gene_id]
         else:
-            if print_gene:
-                seq += line.rstrip()
-    if print_gene:
-        process_and_print_gene(fields, gene_id, seq)
-    fr.close()
+            protein_start_types[gene_id] = gene_to_start_type[
+                                             gff_gene_ids.get(gene_id, gene_id)]
+    if "fork" in multiprocessing.get_all_start_methods():
+        sys.stdout.flush()
+        protein_process = multiprocessing.get_context("fork").Process(
+                              target=write_proteins,
+                              args=(protein_start_types,))
+        protein_process.start()
+    else:
+        write_proteins(protein_start_types)
+write_genes(indexed_files, suffix, gene_to_start_type, sys.stdout.buffer)
 
 
 """Add start_type information to GFF."""
 if suffix == "fna":
-    tmp_file = os.path.dirname(os.path.abspath(args.gff)) + "/tmp.gff"
-    fw = open(tmp_file, "w")
-    fr = open(args.gff, "r")
+    tmp_file = (os.path.dirname(os.path.abspath(args.gff)) + "/tmp.gff" +
+                get_compression_suffix(args.gff))
+    fw = open_output(tmp_file)
+    fr = open_input(args.gff)
     for line in fr:
         if not line or line[0] == "#" or line == "\n":
             continue
@@ -167,4 +347,16 @@ if suffix == "fna":
     fr.close()
     fw.close()
     os.rename(tmp_file, args.gff)
+    if gff_columns is not None:
+        """The start types aren't part of the columns, but the columns have
+        to get the new size of the gff."""
+        gff_columns.save(args.gff_columns,
+                         -1 if get_compression(args.gff) else
+                         os.path.getsize(args.gff))
 
+if protein_process is not None:
+    protein_process.join()
+    if protein_process.exitcode:
+        print("Writing the proteins to " + args.proteins_output + " failed.",
+              file=sys.stderr)
+        sys.exit(1)
@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
+import multiprocessing
 import sys
 import os
+from bisect import bisect_left
+from collections import OrderedDict
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.fasta_index import Fasta_Index
+from imgap.records import Record
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input, get_compression
+from imgap.gff_columns import Gff_Columns, get_written_size
 
 parser = argparse.ArgumentParser(description="""This script merges two or more
                                  GFF files containing gene predictions.
@@ -31,77 +42,69 @@ parser.add_argument("-a", "--allowed_to_overlap_gff",
                     help="""file path to gff containing genes that are allowed
                     to overlap""")
 parser.add_argument("-f", "--fna_file",
-                    metavar="fna_file", type=argparse.FileType('r'),
+                    metavar="fna_file",
                     help="""file path to the fasta file containing the
                     nucleotide sequences of the in the GFF file listed
-                    contigs""")
+                    contigs (uncompressed)""")
 parser.add_argument("-m", "--min_cds_len",
                     metavar="min_cds_len", default=75,
                     help="""minimum length a CDS must have [default: 75]""")
+parser.add_argument("-j", "--jobs",
+                    metavar="jobs", type=int, default=1,
+                    help="""number of processes to merge the contigs with
+                    (each contig gets merged by one process) [default: 1]""")
+parser.add_argument("-c", "--gff_columns",
+                    metavar="gff_columns_file",
+                    help="""file path to additionally write the columns of
+                    the merged gff to (in a binary format the later scripts
+                    can load instead of parsing the gff)""")
 args = parser.parse_args()
 
 
 
 class Alternate_Start_Finder:
-    def __init__(self, fna_file_handle):
-        self.fh = fna_file_handle
-        self.sequence_lookup = {}
-        self.seq_name_2_fh_pos = {}
+    """The fna file gets indexed once. The sequences are read from the memory
+    mapped file when needed and only the most recently used ones are kept
+    (up to max_cached_bps)."""
+    def __init__(self, fna_file, max_cached_bps=100000000):
+        """The sequences get read from the file itself, so it can't be
+        compressed. Checked up front, as otherwise only the first CDS to
+        shorten would fail, after most of the merging is done."""
+        compression = get_compression(fna_file)
+        if compression is not None:
+            print("The fna file (-f) has to be uncompressed, but " + fna_file +
+                  " is " + compression + " compressed! Aborting!",
+                  file=sys.stderr)
+            sys.exit(1)
+        self.fasta_index = Fasta_Index(fna_file, name_is_first_word=True)
+        self.sequence_lookup = OrderedDict()
+        self.cached_bps = 0
+        self.max_cached_bps = max_cached_bps
         self.start_codons = frozenset(["ATG", "GTG", "TTG"])
         self.complements = {"A": "T", "C": "G", "G": "C", "T": "A", "N": "N"}
 
 
-    def read_contig_seq(self):
-        seq = ""
-        """tell() is disabled in a for loop (when next() is invoked).
-        So we have to use while and readline()."""
-        line = self.fh.readline()
-        while not line.startswith(">"):
-            if line == "":
-                # Reached end of file
-#                print("EOF, returning seq of len " + str(len(seq)),
-#                      file=sys.stderr)
-                return seq
-            seq += line.rstrip()
-            line = self.fh.readline()
-        # We just read a contig name line
-        self.fh.seek(self.fh.tell() - len(line))
-        return seq
-
-
     def get_nucleotide_sequence(self, contig_name):
 #        print("Trying to get sequence for contig: " + contig_name,
 #              file=sys.stderr)
         """Check, if we pulled the sequence already."""
         if contig_name in self.sequence_lookup:
-#            print("Found already stored sequence for contig: " + contig_name,
-#                  file=sys.stderr)
+            self.sequence_lookup.move_to_end(contig_name)
             return self.sequence_lookup[contig_name]
-        """Otherwise check, if we know where the sequence starts."""
-        if contig_name in self.seq_name_2_fh_pos:
-#            print("Found stored offset for contig: " + contig_name,
-#                  file=sys.stderr)
-            self.fh.seek(self.seq_name_2_fh_pos[contig_name])
-            self.sequence_lookup[contig_name] = self.read_contig_seq()
-            return self.sequence_lookup[contig_name]
-        """If not, look for the sequence and remember all passed sequences and
-        their positions in the file. (See above tell() comment.)"""
-        line = self.fh.readline()
-        while not line.startswith(">" + contig_name):
-            if line == "":
-                # We are at end of file
-                print("Reached end of file and could not find contig: " +
-                      contig_name + "\nAborting!", file=sys.stderr)
-                os._exit(1)
-            if line.startswith(">"):
-                seq_name = line.rstrip().split("\s", 1)[0][1:]
-#                print("Storing offset for contig: " +seq_name, file=sys.stderr)
-                self.seq_name_2_fh_pos[seq_name] = self.fh.tell()
-            line = self.fh.readline()
-        if line.startswith(">" + contig_name):
-            self.sequence_lookup[contig_name] = self.read_contig_seq()
-            return self.sequence_lookup[contig_name]
-        return None
+        if contig_name not in self.fasta_index:
+            print("Could not find contig: " + contig_name + "\nAborting!",
+                  file=sys.stderr)
+            os._exit(1)
+        seq = self.fasta_index.get_sequence(contig_name)
+        """Evict the least recently used sequences (but always keep the
+        current one)."""
+        while (self.sequence_lookup and
+               self.cached_bps + len(seq) > self.max_cached_bps):
+            evicted_seq = self.sequence_lookup.popitem(last=False)[1]
+            self.cached_bps -= len(evicted_seq)
+        self.sequence_lookup[contig_name] = seq
+        self.cached_bps += len(seq)
+        return seq
 
 
     def get_alternate_start(self, contig_name, min_start, max_start, strand):
@@ -166,7 +169,11 @@ if args.fna_file:
 
 
 
-class Gene:
+class Gene(Record):
+    __slots__ = ("seq_id", "source", "type", "start", "end", "score", "strand",
+                 "phase", "attributes", "childs",
+                 "end_shortened_during_current_iteration")
+
     def __init__(self, fields):
         self.seq_id = fields[0]
         self.source = fields[1]
@@ -177,6 +184,8 @@ class Gene:
         self.strand = fields[6]
         self.phase = fields[7]
         self.attributes = fields[8].rstrip()
+        self.childs = None
+        self.end_shortened_during_current_iteration = False
 # For debugging:
 #        self.id = (self.seq_id + "_" + str(self.start) + "_" + str(self.end) +
 #                   " (" + self.strand + " , " + self.type + " , " +
@@ -185,7 +194,7 @@ class Gene:
 
 
     def add_child(self, gene):
-        if not hasattr(self, "childs"):
+        if self.childs is None:
             self.childs = []
         self.childs.append(gene)
 
@@ -297,19 +306,28 @@ class Gene:
         return True
 
 
-    def to_gff(self):
-        print(self.seq_id + "\t" + self.source + "\t" + self.type + "\t" +
-              str(self.start) + "\t" + str(self.end) + "\t" + self.score +
-              "\t" + self.strand + "\t" + self.phase + "\t" + self.attributes)
-        if hasattr(self, "childs"):
+    def add_gff_lines(self, gff_lines, gff_columns=None):
+        if gff_columns is not None:
+            gff_columns.add(self.seq_id, self.source, self.type, self.start,
+                            self.end, self.strand, self.attributes)
+        gff_lines.append(self.seq_id + "\t" + self.source + "\t" + self.type +
+                         "\t" + str(self.start) + "\t" + str(self.end) + "\t" +
+                         self.score + "\t" + self.strand + "\t" + self.phase +
+                         "\t" + self.attributes)
+        if self.childs is not None:
             for gene in self.childs:
-                gene.to_gff()
+                gene.add_gff_lines(gff_lines, gff_columns)
 
 
 
 class Contig_GFF:
     def __init__(self):
         self.genes = []
+        """End coordinates of the stored genes (same order as self.genes).
+        As long as they are sorted, the next gene ending at or after a given
+        coordinate can be found via bisection instead of a linear scan."""
+        self.ends = []
+        self.ends_sorted = True
         self.last_used_idx = 0
 
 
@@ -317,6 +335,33 @@ class Contig_GFF:
         self.last_used_idx = 0
 
 
+    def append_gene(self, gene):
+        if self.ends and self.ends[-1] > gene.end:
+            self.ends_sorted = False
+        self.genes.append(gene)
+        self.ends.append(gene.end)
+
+
+    def insert_gene(self, idx, gene):
+        if ((idx > 0 and self.ends[idx-1] > gene.end) or
+                (idx < len(self.ends) and gene.end > self.ends[idx])):
+            self.ends_sorted = False
+        self.genes.insert(idx, gene)
+        self.ends.insert(idx, gene.end)
+
+
+    def get_next_idx_ending_at_or_after(self, end):
+        """Returns the index of the first gene from last_used_idx on that ends
+        at or after the given coordinate (or the number of genes if there is
+        none)."""
+        if self.ends_sorted:
+            return max(self.last_used_idx, bisect_left(self.ends, end))
+        idx = self.last_used_idx
+        while idx < len(self.ends) and end > self.ends[idx]:
+            idx += 1
+        return idx
+
+
     def add_gene(self, gene, allowed_overlap_lookup,
                  allowed_to_significantly_overlap=False):
         """If it's a CDS, make sure it has the required minimum length."""
@@ -326,7 +371,7 @@ class Contig_GFF:
 
         """If there are no genes stored yet, just add the gene."""
         if not self.genes:
-            self.genes.append(gene)
+            self.append_gene(gene)
             return True
 
         """Otherwise only add this gene if it is not conflicting with any of
@@ -336,50 +381,63 @@ class Contig_GFF:
 #            print("New gene has > end than last gene in list.",
 #                  file=sys.stderr)
             if allowed_to_significantly_overlap:
-                self.genes.append(gene)
+                self.append_gene(gene)
                 self.last_used_idx = len(self.genes) - 1
                 return True
 
             if (gene.has_no_inacceptable_overlap(self.genes[-1],
                                                    allowed_overlap_lookup)):
-                if (hasattr(gene, "end_shortened_during_current_iteration") and
-                        gene.end_shortened_during_current_iteration == True):
+                if gene.end_shortened_during_current_iteration:
                     self.last_used_idx -= 5
                     if self.last_used_idx < 0:
                         self.last_used_idx = 0
                     gene.end_shortened_during_current_iteration = False
                 else:
-                    self.genes.append(gene)
+                    self.append_gene(gene)
                     self.last_used_idx = len(self.genes) - 1
                     return True
             else:
                 return False
 
         """If not, check if the gene fits between two genes within our overlap
-        costraints."""
-        loop_boundary = len(self.genes) #- 1
-#        print("Loop boundary: " + str(loop_boundary), file=sys.stderr)
-        while self.last_used_idx < loop_boundary:
+        costraints (in front of the next gene that doesn't end before it)."""
+        while True:
+            self.last_used_idx = self.get_next_idx_ending_at_or_after(gene.end)
+            if self.last_used_idx == len(self.genes):
+                break
 #            print("While iteration. LUIDX: " + str(self.last_used_idx) +
 #                  "\nGene end: " +
 #                  str(gene.end) + " , index gene end: " +
 #                  str(self.genes[self.last_used_idx].end), file=sys.stderr)
-            if gene.end <= self.genes[self.last_used_idx].end:
-                if allowed_to_significantly_overlap:
-#                    print("ALLOWED TO OVERLAP. Instering at " +
-#                          str(self.last_used_idx), file=sys.stderr)
-                    self.genes.insert(self.last_used_idx, gene)
-                    return True
+            if allowed_to_significantly_overlap:
+#                print("ALLOWED TO OVERLAP. Instering at " +
+#                      str(self.last_used_idx), file=sys.stderr)
+                self.insert_gene(self.last_used_idx, gene)
+                return True
 
-                if gene.has_no_inacceptable_overlap(self.genes[self.last_used_idx],
-                                                    allowed_overlap_lookup):
-#                    print("    No ina overlap with gene at idx: " +
-#                          str(self.last_used_idx) +
-#                          "\n    Checking with previous now (if present).",
-#                          file=sys.stderr)
-                    if (hasattr(gene, "end_shortened_during_current_iteration")
-                          and
-                          gene.end_shortened_during_current_iteration == True):
+            if gene.has_no_inacceptable_overlap(self.genes[self.last_used_idx],
+                                                allowed_overlap_lookup):
+#                print("    No ina overlap with gene at idx: " +
+#                      str(self.last_used_idx) +
+#                      "\n    Checking with previous now (if present).",
+#                      file=sys.stderr)
+                if gene.end_shortened_during_current_iteration:
+                    self.last_used_idx -= 15
+                    if self.last_used_idx < 0:
+                        self.last_used_idx = 0
+                    gene.end_shortened_during_current_iteration = False
+#                    print("    The gene got shortened and has a new end " +
+#                          "coordinate. Resetting LUIDX to: " +
+#                          str(self.last_used_idx) + "\n    Resetting end " +
+#                          "shortened in current iteration marker to: " +
+#                          "False\n    Going to recompare against " +
+#                          "previous 15 genes now.", file=sys.stderr)
+                    continue
+                if (self.last_used_idx == 0
+                      or
+                      gene.has_no_inacceptable_overlap(self.genes[self.last_used_idx-1],
+                                                       allowed_overlap_lookup)):
+                    if gene.end_shortened_during_current_iteration:
                         self.last_used_idx -= 15
                         if self.last_used_idx < 0:
                             self.last_used_idx = 0
@@ -391,32 +449,13 @@ class Contig_GFF:
 #                              "False\n    Going to recompare against " +
 #                              "previous 15 genes now.", file=sys.stderr)
                         continue
-                    if (self.last_used_idx == 0
-                          or
-                          gene.has_no_inacceptable_overlap(self.genes[self.last_used_idx-1],
-                                                           allowed_overlap_lookup)):
-                        if (hasattr(gene, "end_shortened_during_current_iteration")
-                              and
-                              gene.end_shortened_during_current_iteration == True):
-                            self.last_used_idx -= 15
-                            if self.last_used_idx < 0:
-                                self.last_used_idx = 0
-                            gene.end_shortened_during_current_iteration = False
-#                            print("    The gene got shortened and has a new end " +
-#                                  "coordinate. Resetting LUIDX to: " +
-#                                  str(self.last_used_idx) + "\n    Resetting end " +
-#                                  "shortened in current iteration marker to: " +
-#                                  "False\n    Going to recompare against " +
-#                                  "previous 15 genes now.", file=sys.stderr)
-                            continue
-#                        print("    All good! Instering at " +
-#                              str(self.last_used_idx), file=sys.stderr)
-                        self.genes.insert(self.last_used_idx, gene)
-                        return True
-                return False
-            self.last_used_idx += 1
+#                    print("    All good! Instering at " +
+#                          str(self.last_used_idx), file=sys.stderr)
+                    self.insert_gene(self.last_used_idx, gene)
+                    return True
+            return False
 #        print("    Adding gene to the end of the list.", file=sys.stderr)
-        self.genes.append(gene)
+        self.append_gene(gene)
 #        return False
         return True
 
@@ -425,16 +464,23 @@ class Contig_GFF:
         self.genes[self.last_used_idx].add_child(gene)
 
 
-    def to_gff(self):
+    def get_gff_lines(self, gff_columns=None):
         self.genes.sort(key=lambda g: g.start)
+        gff_lines = []
         for gene in self.genes:
-            gene.to_gff()
+            gene.add_gff_lines(gff_lines, gff_columns)
+        return gff_lines
+
+
+    def to_gff(self, gff_writer, gff_columns=None):
+        for gff_line in self.get_gff_lines(gff_columns):
+            gff_writer.write_line(gff_line)
 
 
 
 
 class GFF_Files_Merger:
-    def __init__(self, gff_file):
+    def __init__(self, gff_file=None):
         self.final_gff_data = {}
         self.allowed_overlap_lookup = {}
         self.allowed_overlap_lookup["rRNA"] = 10
@@ -445,15 +491,22 @@ class GFF_Files_Merger:
         self.allowed_overlap_lookup["CDS"] = 90
         self.contig_sequence_lookup = None
         self.previous_gene_stored = False
-        self.add_genes_from_file(gff_file)
+        if gff_file:
+            self.add_genes_from_file(gff_file)
 
 
     def add_genes_from_file(self, gff_file,
                             allowed_to_significantly_overlap=False):
-        fr = open(gff_file, "r")
+        fr = open_input(gff_file)
+        self.add_genes_from_lines(fr, allowed_to_significantly_overlap)
+        fr.close()
+
+
+    def add_genes_from_lines(self, lines,
+                             allowed_to_significantly_overlap=False):
         seq_name = ""
         self.previous_gene_stored = False
-        for line in fr:
+        for line in lines:
             """Ignore comments or empty lines."""
             if not line or line[0] == "#" or line == "\n":
                 continue
@@ -487,30 +540,91 @@ class GFF_Files_Merger:
                                                         allowed_to_significantly_overlap)
 #            print(gene.id + " got stored: " + str(self.previous_gene_stored) +
 #                  "\n", file=sys.stderr)
-        fr.close()
 
 
-    def print_final_gff(self):
+    def print_final_gff(self, gff_columns=None):
+        gff_writer = Gff_Writer()
         for seq_name in sorted(self.final_gff_data):
-            self.final_gff_data[seq_name].to_gff()
-
-
+            self.final_gff_data[seq_name].to_gff(gff_writer, gff_columns)
+        gff_writer.flush()
 
-#print("INSERTING " + args.main_gff, file=sys.stderr)
-gff_files_merger = GFF_Files_Merger(args.main_gff)
-"""Now add the remaining GFFs."""
-for gff_file in args.other_gffs:
-#    print("\nINSERTING " + gff_file, file=sys.stderr)
-    gff_files_merger.add_genes_from_file(gff_file)
 
-"""Add genes that can overlap completely with everything."""
-if args.allowed_to_overlap_gff:
-    allowed_to_significantly_overlap = True
-#    print("\nINSERTING ALLOWED TO OVERLAP FILE " + args.allowed_to_overlap_gff,
-#         file=sys.stderr)
-    gff_files_merger.add_genes_from_file(args.allowed_to_overlap_gff,
-                                         allowed_to_significantly_overlap)
-
-"""Print out the final GFF"""
-gff_files_merger.print_final_gff()
 
+def get_contig_blocks(gff_files):
+    """Groups the lines of the given (gff file, allowed to overlap) pairs by
+    contig. Each contig gets the blocks of consecutive lines on it, in the
+    order the merger would see them."""
+    contig_blocks = {}
+    for gff_file, allowed_to_significantly_overlap in gff_files:
+        seq_name = ""
+        with open_input(gff_file) as fr:
+            for line in fr:
+                if not line or line[0] == "#" or line == "\n":
+                    continue
+                line_seq_name = line.split("\t", 1)[0]
+                if line_seq_name != seq_name:
+                    seq_name = line_seq_name
+                    lines = []
+                    if seq_name not in contig_blocks:
+                        contig_blocks[seq_name] = []
+                    contig_blocks[seq_name].append((allowed_to_significantly_overlap,
+                                                    lines))
+                lines.append(line)
+    return contig_blocks
+
+
+
+def merge_contig(seq_name):
+    """Runs in the worker processes, which got the contig blocks via fork()."""
+    gff_files_merger = GFF_Files_Merger()
+    for allowed_to_significantly_overlap, lines in contig_blocks[seq_name]:
+        """Every block starts like a new contig section in a GFF file (resets
+        the index tracker)."""
+        gff_files_merger.add_genes_from_lines(lines,
+                                              allowed_to_significantly_overlap)
+    gff_columns = Gff_Columns() if args.gff_columns else None
+    gff_lines = gff_files_merger.final_gff_data[seq_name].get_gff_lines(
+                    gff_columns)
+    return "".join(gff_line + "\n" for gff_line in gff_lines), gff_columns
+
+
+
+gff_columns = Gff_Columns() if args.gff_columns else None
+if args.jobs > 1:
+    gff_files = [(args.main_gff, False)]
+    gff_files.extend((gff_file, False) for gff_file in args.other_gffs)
+    if args.allowed_to_overlap_gff:
+        gff_files.append((args.allowed_to_overlap_gff, True))
+    contig_blocks = get_contig_blocks(gff_files)
+    seq_names = sorted(contig_blocks)
+    with multiprocessing.get_context("fork").Pool(args.jobs) as pool:
+        for gff_text, contig_gff_columns in pool.imap(
+                merge_contig, seq_names,
+                max(1, len(seq_names) // (args.jobs * 16))):
+            sys.stdout.write(gff_text)
+            if gff_columns is not None:
+                gff_columns.extend(contig_gff_columns)
+else:
+#    print("INSERTING " + args.main_gff, file=sys.stderr)
+    gff_files_merger = GFF_Files_Merger(args.main_gff)
+    """Now add the remaining GFFs."""
+    for gff_file in args.other_gffs:
+#        print("\nINSERTING " + gff_file, file=sys.stderr)
+        gff_files_merger.add_genes_from_file(gff_file)
+
+    """Add genes that can overlap completely with everything."""
+    if args.allowed_to_overlap_gff:
+        allowed_to_significantly_overlap = True
+#        print("\nINSERTING ALLOWED TO OVERLAP FILE " + args.allowed_to_overlap_gff,
+#             file=sys.stderr)
+        gff_files_merger.add_genes_from_file(args.allowed_to_overlap_gff,
+                                             allowed_to_significantly_overlap)
+
+    """Print out the final GFF"""
+    gff_files_merger.print_final_gff(gff_columns)
+
+if gff_columns is not None:
+    """The size of the written gff lets the later scripts check that the
+    columns belong to it."""
+    sys.stdout.flush()
+    gff_columns.save(args.gff_columns, get_written_size(sys.stdout))
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import argparse
 import fileinput
 
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.records import Record
+from imgap.intervals import remove_group_overlaps
+from imgap.gff_writer import Gff_Writer
+from imgap.compressed_io import open_input, input_file_type
+from imgap.hmmer_tables import (read_tblout, open_tables,
+                                get_merged_hits_by_target)
+
 
 parser = argparse.ArgumentParser(description="""This script expects to get via
 stdin columns 1, 3, 4, 6, 7, 8, 9, 10, 11, 15, 16 (gene_id, accession, model,
@@ -16,16 +26,31 @@ claninfo file that can get downloaded together with the database and the
 Rfam-IMG-NCBI feature lookup file.
 For all hits to a seqeunce the script then checks if two hits overlap and if so
 additionally checks if the two hits belong to the same class. If that's the
-case the lower scoring hit gets removed.""")
+case the lower scoring hit gets removed.
+With --tblout the input is the tblout itself, as written by cmsearch, and the
+included hits get selected and sorted by the script. Several tblouts (e.g. of
+cmsearch runs on splits of the contigs) get merged.""")
 parser.add_argument("cmsearch_version", help="""cmsearch version used to create
                     the input""")
-parser.add_argument("clan_info_file", type=argparse.FileType('r'),
+parser.add_argument("clan_info_file", type=input_file_type,
                     help="""the full path to the clan info file""")
-parser.add_argument("feature_lookup_file", type=argparse.FileType('r'),
+parser.add_argument("feature_lookup_file", type=input_file_type,
                     help="""the full path to the feature lookup file""")
+parser.add_argument("-t", "--tblout", action="store_true",
+                    help="""the input is an unsorted tblout instead of the
+                    selected and sorted columns""")
+parser.add_argument("-m", "--max_hits_in_memory", type=int, default=2000000,
+                    help="""maximum number of hits to sort in memory with
+                    --tblout (more hits get sorted in runs that are written
+                    to tmp files and merged)""")
 parser.add_argument("-v", "--version", action="version",
-                    version="%(prog)s 1.0.0")
-args, input = parser.parse_known_args()
+                    version="%(prog)s 1.1.1")
+
+
+"""The tblout columns the script expects, in the expected order."""
+TBLOUT_ATTRIBUTES = ("target_name", "query_name", "query_accession",
+                     "model_start", "model_end", "seq_start", "seq_end",
+                     "strand", "trunc", "bitscore", "evalue")
 
 
 
@@ -56,6 +81,10 @@ class Clan_Lookup:
         return False
 
 
+    def get_clan(self, hit):
+        return self.lookup.get(hit.accession)
+
+
 
 
 class Feature_Lookup:
@@ -100,15 +129,20 @@ class Feature_Lookup:
 
 
 
-class Hit:
+class Hit(Record):
+    __slots__ = ("seq_name", "accession", "model", "model_start", "model_end",
+                 "seq_start", "seq_end", "strand", "trunc", "bitscore",
+                 "evalue")
+
     def __init__(self, fields):
+        """Expects the coordinates as ints (see get_hit_fields())."""
         self.seq_name = fields[0]
         self.accession = fields[1]
         self.model = fields[2]
         self.model_start = fields[3]
         self.model_end = fields[4]
-        self.seq_start = int(fields[5])
-        self.seq_end = int(fields[6])
+        self.seq_start = fields[5]
+        self.seq_end = fields[6]
         self.strand = fields[7]
         if self.strand == "-":
             self.seq_start, self.seq_end = self.seq_end, self.seq_start
@@ -119,9 +153,9 @@ class Hit:
 #                   str(self.seq_end))
 
 
-    def to_gff(self, feature_lookup):
+    def to_gff(self, cmsearch_version, feature_lookup, gff_writer):
         gff_line = (self.seq_name + "\t" +
-                    args.cmsearch_version + "\t" +
+                    cmsearch_version + "\t" +
                     feature_lookup.get_ncbi_locus_type(self.model) + "\t" +
                     str(self.seq_start) + "\t" +
                     str(self.seq_end) + "\t" +
@@ -133,12 +167,12 @@ class Hit:
                     ";e-value=" + self.evalue +
                     ";model=" + self.model +
                     ";accession=" + self.accession +
-                    ";model_start=" + self.model_start +
-                    ";model_end=" + self.model_end +
+                    ";model_start=" + str(self.model_start) +
+                    ";model_end=" + str(self.model_end) +
                     ";" + feature_lookup.get_additional_qualifiers(self.model))
         if self.trunc != "no":
             gff_line += ";partial=" + self.trunc.replace("&", ",")
-        print(gff_line)
+        gff_writer.write_line(gff_line)
 
 
     def get_overlap_length(self, other_hit):
@@ -164,50 +198,73 @@ class Sequence_Hits:
         self.hits.append(hit)
 
     def remove_clan_overlaps(self, clan_lookup):
-        if len(self.hits) > 0:
-            ignore = set()
-            for i in range(0, len(self.hits)-1):
-                if i not in ignore:
-                    for j in range(i+1, len(self.hits)):
-                        if j not in ignore:
-                            if (self.hits[i].get_overlap_length(self.hits[j]) > 0
-                                 and
-                                 clan_lookup.belong_to_the_same_clan(self.hits[i],
-                                                                     self.hits[j])):
-                                ignore.add(j)
-            cleaned_hits = [self.hits[0]]
-            for i in range(1, len(self.hits)):
-                if i not in ignore:
-                    cleaned_hits.append(self.hits[i])
-            self.hits = cleaned_hits
-
-    def to_gff(self, feature_lookup):
+        """Keeps the hits (sorted by bitscore and evalue) unless they overlap
+        a better hit of the same clan."""
+        self.hits = remove_group_overlaps(self.hits, clan_lookup.get_clan,
+                                          lambda h: (h.seq_start, h.seq_end))
+
+    def to_gff(self, cmsearch_version, feature_lookup, gff_writer):
         # Sort by start coordinate first
         self.hits.sort(key=lambda h: h.seq_start)
         for hit in self.hits:
-            hit.to_gff(feature_lookup)
+            hit.to_gff(cmsearch_version, feature_lookup, gff_writer)
 
 
 
-# Start script by building lookups
-clan_lookup = Clan_Lookup(args.clan_info_file)
-feature_lookup = Feature_Lookup(args.feature_lookup_file)
+def get_hit_fields(fields):
+    fields[3] = int(fields[3])
+    fields[4] = int(fields[4])
+    fields[5] = int(fields[5])
+    fields[6] = int(fields[6])
+    return fields
 
-current_seq = ""
-sequence_hits = Sequence_Hits()
-# Run over stdin
-for line in fileinput.input(input):
-    hit = Hit(line.rstrip().split())
 
-    if hit.seq_name != current_seq:
-        # Now we look at the hits for a new sequence
-        sequence_hits.remove_clan_overlaps(clan_lookup)
-        sequence_hits.to_gff(feature_lookup)
+def filter_tblouts(tblouts, cmsearch_version, clan_lookup, feature_lookup,
+                   gff_writer, max_hits_in_memory=None):
+    hit_streams = [(hit for hit in read_tblout(tblout) if hit.inclusion == "!")
+                   for tblout in tblouts]
+    for seq_name, seq_hits in get_merged_hits_by_target(hit_streams,
+                                                         TBLOUT_ATTRIBUTES,
+                                                         "bitscore", "evalue",
+                                                         max_hits_in_memory):
         sequence_hits = Sequence_Hits()
-        current_seq = hit.seq_name
-
-    sequence_hits.add_hit(hit)
-
-sequence_hits.remove_clan_overlaps(clan_lookup)
-sequence_hits.to_gff(feature_lookup)
-
+        for hit_fields in seq_hits:
+            sequence_hits.add_hit(Hit(hit_fields))
+        sequence_hits.remove_clan_overlaps(clan_lookup)
+        sequence_hits.to_gff(cmsearch_version, feature_lookup, gff_writer)
+
+
+
+if __name__ == "__main__":
+    args, input = parser.parse_known_args()
+
+    # Start script by building lookups
+    clan_lookup = Clan_Lookup(args.clan_info_file)
+    feature_lookup = Feature_Lookup(args.feature_lookup_file)
+    gff_writer = Gff_Writer()
+    if args.tblout:
+        filter_tblouts(open_tables(input), args.cmsearch_version,
+                       clan_lookup, feature_lookup, gff_writer,
+                       args.max_hits_in_memory)
+        gff_writer.flush()
+        sys.exit(0)
+
+    current_seq = ""
+    sequence_hits = Sequence_Hits()
+    # Run over stdin
+    for line in fileinput.input(input, openhook=open_input):
+        hit = Hit(get_hit_fields(line.rstrip().split()))
+
+        if hit.seq_name != current_seq:
+            # Now we look at the hits for a new sequence
+            sequence_hits.remove_clan_overlaps(clan_lookup)
+            sequence_hits.to_gff(args.cmsearch_version, feature_lookup,
+                                 gff_writer)
+            sequence_hits = Sequence_Hits()
+            current_seq = hit.seq_name
+
+        sequence_hits.add_hit(hit)
+
+    sequence_hits.remove_clan_overlaps(clan_lookup)
+    sequence_hits.to_gff(args.cmsearch_version, feature_lookup, gff_writer)
+    gff_writer.flush()
@@ -220,11 +220,15 @@ fi
 
 
 final_gff=${imgap_input_fasta%_*}_structural_annotation.gff
+# Binary columns of the final gff, which the later steps load instead of
+# parsing the gff again.
+final_gff_columns=${final_gff}.cols
 if [[ ! -f $run_folder/GFF_MERGE_DONE ]]
 then
     echo "$(date +%F_%T) - Merging gff files now..."
     echo "GFF Merging" >> $run_folder/started_modules.log
-    merger_args="-f $imgap_input_fasta"
+    merger_args="-f $imgap_input_fasta -j $((imgap_additional_threads + 1))"
+    merger_args="$merger_args -c $final_gff_columns"
     if [[ "$imgap_structural_annotation_rfam_execute" == "True" ]]
     then
         misc_and_regulatory_gff=${imgap_input_fasta%_*}_rfam_misc_bind_misc_feature_regulatory.gff
@@ -293,6 +297,13 @@ else
     echo "$(date +%F_%T) - GFF files merging appears to have been run earlier already. Skipping!"
 fi
 
+# Merges done by earlier versions didn't write the columns.
+gff_columns_args=""
+if [[ -f $final_gff_columns ]]
+then
+    gff_columns_args="-c $final_gff_columns"
+fi
+
 if [[ "$imgap_structural_annotation_prodigal_execute" == "True" ||
 		"$imgap_structural_annotation_genemark_execute" == "True" ]]
 then
@@ -301,13 +312,14 @@ then
         final_genes=${imgap_input_fasta%_*}_genes.fna
         final_proteins=${imgap_input_fasta%_*}_proteins.faa
         ff_genes_args="$final_gff"
-        ff_proteins_args="$final_gff"
+        ff_proteins_args=""
 
         echo "Fasta Merging" >> $run_folder/started_modules.log
 
-        echo "$(date +%F_%T) - Creating final genes fasta file(s) now..."
-        # We can't ran the next two commands in parallel, since
-        # the fna (genes) run also rewrites the gff file.
+        echo "$(date +%F_%T) - Creating final genes and proteins fasta file(s) now..."
+        # The proteins need the start types found in the genes (and the
+        # genes run also rewrites the gff file), so both get created by one
+        # run, which writes the proteins alongside the genes.
         if [[ "$imgap_structural_annotation_genemark_execute" == "True" ]]
         then
             genemark_genes=${imgap_input_fasta%_*}_genemark_genes.fna
@@ -324,20 +336,12 @@ then
             ff_proteins_args="$ff_proteins_args $prodigal_proteins"
         fi
 
-        $sa_bin_dir/fasta_files_merger.py $ff_genes_args 1> $final_genes
-        exit_code=$?
-        if [[ $exit_code -ne 0 ]]
-        then
-                echo "Creating the final genes fasta file(s) failed." >&2
-            exit $exit_code
-        fi
-
-        echo "$(date +%F_%T) - Creating the final proteins fasta file(s) now..."
-        $sa_bin_dir/fasta_files_merger.py $ff_proteins_args 1> $final_proteins
+        $sa_bin_dir/fasta_files_merger.py $ff_genes_args $gff_columns_args \
+            -p $ff_proteins_args -o $final_proteins 1> $final_genes
         exit_code=$?
         if [[ $exit_code -ne 0 ]]
         then
-            echo "Creating the final proteins fasta files failed." >&2
+            echo "Creating the final genes and proteins fasta file(s) failed." >&2
             exit $exit_code
         fi
 
@@ -352,7 +356,8 @@ if [[ "$imgap_structural_annotation_gff_and_fasta_stats_execute" == "True" ]]
 then
     echo "$(date +%F_%T) - Calculating gff and final fasta stats now..."
     echo "GFF and Fasta Stats" >> $run_folder/started_modules.log
-    $sa_bin_dir/gff_and_final_fasta_stats.py $imgap_input_fasta $final_gff
+    $sa_bin_dir/gff_and_final_fasta_stats.py $imgap_input_fasta $final_gff \
+        $gff_columns_args
     exit_code=$?
     if [[ $exit_code -ne 0 ]]
     then
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.structural_stats import Structural_Stats
+
+parser = argparse.ArgumentParser(description="""This script merges the
+                                 structural annotation stats partials of two
+                                 or more splits (written by
+                                 gff_and_final_fasta_stats.py -p) and writes
+                                 the stats of the whole project, as if
+                                 gff_and_final_fasta_stats.py had been run on
+                                 the concatenated fasta and GFF files of the
+                                 splits (in the given order).
+
+                                 The sequence names have to be unique across
+                                 the splits.""")
+parser.add_argument("partials_files", metavar="partials_file", nargs="+",
+                    help="""file path(s) to the stats partials of the
+                    splits""")
+parser.add_argument("-o", "--output", metavar="stats_tsv", required=True,
+                    help="""file path to write the merged stats to (in the
+                    _structural_annotation_stats.tsv format)""")
+parser.add_argument("-p", "--partials", metavar="partials_file",
+                    help="""file path to additionally write the merged stats
+                    partials to""")
+args = parser.parse_args()
+
+
+structural_stats = Structural_Stats()
+for partials_file in args.partials_files:
+    try:
+        structural_stats.merge(Structural_Stats.load(partials_file))
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+structural_stats.write_tables(args.output)
+if args.partials:
+    structural_stats.save(args.partials)
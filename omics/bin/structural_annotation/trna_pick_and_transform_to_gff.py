@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
-#import sys
+import os
+import sys
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                os.pardir))
+from imgap.gff_writer import Gff_Writer
 
 
 parser = argparse.ArgumentParser(description="""This script parses one or more
@@ -57,7 +62,7 @@ class tRNA:
             self.note = None
 
 
-    def to_gff(self, contig_name, source, search_mode):
+    def to_gff(self, contig_name, source, search_mode, gff_writer):
         """These operations could be executed during object initialization, but
         they are actually only needed for the ones that get printed out."""
         intron_str = None
@@ -95,7 +100,7 @@ class tRNA:
         if self.note:
             gff_line += ";note=" + self.note
 
-        print(gff_line)
+        gff_writer.write_line(gff_line)
 
 
 
@@ -130,11 +135,12 @@ class Contig_Results:
         return False
 
 
-    def to_gff(self):
+    def to_gff(self, gff_writer):
         # Sort tRNA list by start coordinates first
         self.tRNAs.sort(key=lambda t: int(t.start))
         for trna in self.tRNAs:
-            trna.to_gff(self.contig_name, self.source, self.search_mode)
+            trna.to_gff(self.contig_name, self.source, self.search_mode,
+                        gff_writer)
 
 
 
@@ -194,6 +200,8 @@ for results_file in args.trnascan_output_files:
         best_contigs_results[contig_name] = contig_results
 
 # Print out final results
+gff_writer = Gff_Writer()
 for contig_name in sorted(best_contigs_results.keys()):
-    best_contigs_results[contig_name].to_gff()
+    best_contigs_results[contig_name].to_gff(gff_writer)
+gff_writer.flush()
 
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import multiprocessing
 import os
 
 parser = argparse.ArgumentParser(description="""This script changes the gene
@@ -16,9 +17,17 @@ parser.add_argument("gff", metavar="gff_file",
                     help="file path to the gff file")
 parser.add_argument("fasta_files", metavar="fasta_files", nargs="+",
                     help="file path(s) to the gene/protein fasta file(s)")
+parser.add_argument("-p", "--processes", type=int,
+                    help="""number of fasta files to rewrite at the same time
+                    (default: one process per fasta file, at most the number
+                    of cpus)""")
 args = parser.parse_args()
 
 
+"""Number of bytes to read at once from the fasta files."""
+BLOCK_SIZE = 1 << 24
+
+
 partial_gene_info = {}
 seq_to_translation_table = {}
 
@@ -117,22 +126,68 @@ def rewrite_genemark_line(line):
     return (" # ".join(new_fields) + "\n")
 
 
-"""Now loop over the fasta files."""
-for fasta_file in args.fasta_files:
+def find_header_line(block, start):
+    """Returns the start of the next header line at or after start (which has
+    to be the start of a line) or -1."""
+    if block.startswith(b">", start):
+        return start
+    index = block.find(b"\n>", start)
+    return index + 1 if index != -1 else -1
+
+
+def rewrite_headers(block, rewrite_header_line):
+    """Rewrites the header lines of a block of complete fasta lines and
+    copies the sequence lines in between verbatim."""
+    pieces = []
+    position = 0
+    header_start = find_header_line(block, 0)
+    while header_start != -1:
+        pieces.append(block[position:header_start])
+        header_end = block.find(b"\n", header_start) + 1 or len(block)
+        line = block[header_start:header_end].decode()
+        pieces.append(rewrite_header_line(line).encode())
+        position = header_end
+        header_start = find_header_line(block, header_end)
+    pieces.append(block[position:])
+    return b"".join(pieces)
+
+
+def rewrite_fasta_file(fasta_file):
     """Creating a tmp file for every fasta file in the same folder to avoid the
     OSError: [Errno 18] Invalid cross-device link
-    problem that can happen with os.rename."""
-    tmp_file = os.path.dirname(os.path.abspath(fasta_file)) + "/tmp_" + str(os.getpid()) + ".fasta"
-    fw = open(tmp_file, "w")
-    fr = open(fasta_file, "r")
-    for line in fr:
-        if line[0] == ">":
-            if "Prodigal" in tool_and_version:
-                line = rewrite_prodigal_line(line)
-            else:
-                line = rewrite_genemark_line(line)
-        fw.write(line)
-    fr.close()
-    fw.close()
+    problem that can happen with os.rename. The fasta files get rewritten
+    concurrently, so the tmp file names include the fasta file name."""
+    if "Prodigal" in tool_and_version:
+        rewrite_header_line = rewrite_prodigal_line
+    else:
+        rewrite_header_line = rewrite_genemark_line
+    tmp_file = (os.path.dirname(os.path.abspath(fasta_file)) + "/tmp_" +
+                str(os.getpid()) + "_" + os.path.basename(fasta_file))
+    with open(fasta_file, "rb") as fr, open(tmp_file, "wb") as fw:
+        """Blocks are cut after their last newline, so that the header lines
+        never get split; the rest gets carried over to the next block."""
+        rest = b""
+        for block in iter(lambda: fr.read(BLOCK_SIZE), b""):
+            block = rest + block
+            block_end = block.rfind(b"\n") + 1
+            rest = block[block_end:]
+            if block_end:
+                fw.write(rewrite_headers(block[:block_end],
+                                         rewrite_header_line))
+        if rest:
+            fw.write(rewrite_headers(rest, rewrite_header_line))
     os.rename(tmp_file, fasta_file)
 
+
+"""Now rewrite the fasta files. They are independent of each other, so they
+get rewritten in parallel by forked processes, which share the lookups built
+from the gff file."""
+processes = args.processes or min(len(args.fasta_files),
+                                  os.cpu_count() or 1)
+if (processes > 1 and len(args.fasta_files) > 1 and
+        "fork" in multiprocessing.get_all_start_methods()):
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        pool.map(rewrite_fasta_file, args.fasta_files, chunksize=1)
+else:
+    for fasta_file in args.fasta_files:
+        rewrite_fasta_file(fasta_file)